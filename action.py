@@ -12,6 +12,9 @@ class Action(Enum):
     ENTER = 5
     RESET = 6
     EXIT = 7
+    HINT = 8
+    UNDO = 9
+    REDO = 10
 
     def __eq__(self, other):
         return isinstance(other, Action) and other.value == self.value
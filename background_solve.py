@@ -0,0 +1,166 @@
+"""Solving of a level in a worker process, so that the level can be played while it is solved"""
+
+import multiprocessing
+import signal
+import threading
+import time
+
+from level import Level
+from replay import format_moves
+import solver
+
+PROGRESS_INTERVAL = 0.2
+# expanded states between checks whether the solve was cancelled
+CANCEL_INTERVAL = 1000
+# seconds a cancelled worker has to stop before it is killed
+CANCEL_TIMEOUT = 1.0
+
+
+class SolveCancelled(Exception):
+    """Raised in the worker once the owner cancels the solve"""
+
+
+def _worker(connection, cancelled, level: Level, engine: str, paths: bool, known: tuple, anytime: bool):
+    """Solves a level in a child process, sends the progress and the result through the connection
+
+    The result is the optimal count of moves and, if paths is set, an optimal solution found with the push engine
+    using the known remaining counts of moves and next moves. If anytime is set, the anytime solver is used and the
+    count of moves of every better solution found on the way is sent too. The solve stops without a result once the
+    cancelled event is set."""
+    # the forked worker inherits the SIGTERM handler of SDL after pygame.init(), which would ignore terminate()
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    def check_cancel(current: solver.SolverStats):
+        if current.result is None and cancelled.is_set():
+            raise SolveCancelled()
+
+    stats = solver.SolverStats(check_cancel, CANCEL_INTERVAL)
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def report_progress():
+        while not done.wait(PROGRESS_INTERVAL):
+            with lock:
+                connection.send(("progress", stats.expanded))
+
+    reporter = threading.Thread(target=report_progress, daemon=True)
+    reporter.start()
+
+    def report_bound(moves: int):
+        with lock:
+            connection.send(("bound", moves))
+
+    try:
+        if anytime:
+            board = level.get_board()
+            report = solver.solve_anytime(board, board.pack(level.game_status), stats=stats, callback=report_bound)
+            path = format_moves(report["path"]) if paths and report["path"] is not None else None
+            message = ("result", (report["moves"], path))
+        elif paths:
+            board = level.get_board()
+            known, known_moves = known if known is not None else (None, None)
+            directions = solver.solve_path(board, board.pack(level.game_status), stats=stats, known=known,
+                                           known_moves=known_moves)
+            message = ("result", (-1, None) if directions is None else (len(directions), format_moves(directions)))
+        else:
+            message = ("result", (level.solve(engine, stats=stats), None))
+    except SolveCancelled:
+        message = None
+    except ValueError as e:
+        message = ("error", str(e))
+    except Exception as e:
+        message = ("error", "An unexpected error occurred: " + str(e))
+    done.set()
+    reporter.join()
+    with lock:
+        if message is not None:
+            connection.send(message)
+        connection.close()
+
+
+class BackgroundSolve:
+    """Finds the optimal count of moves of a level in a worker process, unless it is cached already
+
+    If paths is set, an optimal solution is found too, known are the remaining counts of moves and next moves of
+    statuses with a known solution. If anytime is set, best is the count of moves of the best solution found so far
+    until the optimal one is proven. The owner polls it for the progress and the result and can cancel it at any
+    time."""
+
+    def __init__(self, level: Level, engine: str = "push", paths: bool = False, known: tuple = None,
+                 anytime: bool = False):
+        self.level = level
+        self.key = level.get_hash()
+        self.expanded = 0
+        self.best = None
+        self.moves = None
+        self.path = None
+        self.error = None
+        self.process = None
+        self.connection = None
+        self.cancelled = None
+        cached = None if level.cache is None else level.cache.get(self.key)
+        if cached is not None and (not paths or cached.get("path") is not None or cached["moves"] == -1):
+            self.path = cached.get("path")
+            self.finish(cached["moves"])
+            return
+        self.done = False
+        self.connection, sender = multiprocessing.Pipe(False)
+        self.cancelled = multiprocessing.Event()
+        self.process = multiprocessing.Process(target=_worker, daemon=True,
+                                               args=(sender, self.cancelled, level, engine, paths, known, anytime))
+        self.process.start()
+        sender.close()
+
+    def finish(self, optimal_moves: int):
+        """Stores the result into the level"""
+        self.done = True
+        self.moves = optimal_moves
+        self.best = None if optimal_moves == -1 else optimal_moves
+        self.level.optimal_moves = optimal_moves
+        self.level.proven = True
+        if optimal_moves == -1:
+            self.error = "Level is not solvable"
+
+    def poll(self, timeout: float = 0) -> bool:
+        """Reads the messages of the worker, waiting up to timeout seconds, returns True once it is done"""
+        if self.done:
+            return True
+        deadline = time.perf_counter() + timeout
+        try:
+            while self.connection.poll(max(0.0, deadline - time.perf_counter())):
+                kind, value = self.connection.recv()
+                if kind == "progress":
+                    self.expanded = value
+                    continue
+                if kind == "bound":
+                    self.best = value
+                    continue
+                if kind == "result":
+                    moves, self.path = value
+                    if self.level.cache is not None:
+                        self.level.cache.put(self.key, moves, self.path)
+                    self.finish(moves)
+                else:
+                    self.done = True
+                    self.error = value
+                self.process.join()
+                self.connection.close()
+                return True
+        except EOFError:
+            self.done = True
+            self.error = "Solver exited with code " + str(self.process.exitcode)
+            self.process.join()
+        return self.done
+
+    def cancel(self):
+        """Stops the worker if it is still solving, the worker is killed if it does not stop within CANCEL_TIMEOUT"""
+        if self.done:
+            return
+        self.done = True
+        self.error = "Cancelled"
+        self.cancelled.set()
+        self.process.join(CANCEL_TIMEOUT)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.connection.close()
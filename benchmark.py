@@ -0,0 +1,345 @@
+"""Benchmarks of the solver, state transitions, level I/O and rendering, compared against a stored baseline"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+import constants as const
+from board import MOVE_ACTIONS
+from level import Level
+import solver
+
+try:
+    import resource
+except ImportError:  # not available on Windows, the peak memory is then not measured
+    resource = None
+try:
+    import signal
+    TIMER = signal.ITIMER_REAL
+except (ImportError, AttributeError):  # not available on Windows, the parent terminates the benchmark instead
+    TIMER = None
+
+DEFAULT_BASELINE = "./benchmark_baseline.json"
+LEVEL_DIRECTORIES = ("./levels", "./levels/too complex for bfs")
+SYNTHETIC_SIZES = (6, 9, 12, 15)
+MIN_SOLVE_TIME = 0.5
+TRANSITIONS = 20000
+HASHES = 20000
+LOADS = 500
+FRAMES = 300
+# width and height of the synthetic level of the large level benchmarks
+LARGE_SIZE = 1000
+LARGE_LOADS = 10
+
+
+class BenchmarkTimeout(Exception):
+    """Raised in a benchmark process once its time budget is spent"""
+
+
+def synthetic_level(size: int) -> Level:
+    """Generates an empty square room with two boxes in the middle and their destinations in opposite corners"""
+    matrix = np.zeros((size, size), np.uint8)
+    matrix[[0, -1], :] = const.WALL
+    matrix[:, [0, -1]] = const.WALL
+    matrix[1, 1] = const.DESTINATION
+    matrix[size - 2, size - 2] = const.DESTINATION
+    middle = size // 2
+    level = Level(False, cache=None)
+    level.matrix = matrix
+    level.game_status.box_pos = frozenset({(middle - 1, middle - 1), (middle, middle)})
+    level.game_status.player_pos = np.array([1, size - 2], const.POSITION)
+    return level
+
+
+def load_level(filepath: str) -> Level:
+    """Loads a level without the solver cache, so that it is really solved"""
+    return Level(False, filepath, cache=None)
+
+
+def bench_solve(get_level, engine: str) -> tuple:
+    """Solves a level, counts the expanded states until it is solved or the time budget is spent
+
+    Levels solved quickly are solved repeatedly for at least MIN_SOLVE_TIME seconds, so that the rate is stable."""
+    stats = solver.SolverStats()
+    start = time.perf_counter()
+    try:
+        get_level().solve(engine, stats=stats)
+        while time.perf_counter() - start < MIN_SOLVE_TIME:
+            get_level().solve(engine, stats=stats)
+    except BenchmarkTimeout:
+        return stats.expanded, "states/s", False
+    return stats.expanded, "states/s", True
+
+
+def random_actions(count: int) -> list:
+    """Generates a reproducible random walk"""
+    generator = random.Random(0)
+    return [generator.choice(MOVE_ACTIONS) for _ in range(count)]
+
+
+def bench_game_status(filepath: str) -> tuple:
+    """Applies a random walk to a GameStatus"""
+    level = load_level(filepath)
+    status = level.game_status
+    for action in random_actions(TRANSITIONS):
+        status = status.handle_action(action, level.matrix)
+    return TRANSITIONS, "moves/s", True
+
+
+def bench_packed_status(filepath: str) -> tuple:
+    """Applies a random walk to a PackedStatus"""
+    level = load_level(filepath)
+    board = level.get_board()
+    status = board.pack(level.game_status)
+    for action in random_actions(TRANSITIONS):
+        status = status.handle_action(action, board)
+    return TRANSITIONS, "moves/s", True
+
+
+def bench_hash_eq(filepath: str) -> tuple:
+    """Hashes and compares the statuses of a random walk"""
+    level = load_level(filepath)
+    statuses = [level.game_status]
+    for action in random_actions(HASHES // 10):
+        statuses.append(statuses[-1].handle_action(action, level.matrix))
+    count = 0
+    while count < HASHES:
+        seen = set()
+        for status in statuses:
+            seen.add(status)
+        count += len(statuses)
+    return count, "ops/s", True
+
+
+def bench_load(filepath: str) -> tuple:
+    """Loads a level from its file"""
+    level = load_level(filepath)
+    for _ in range(LOADS):
+        level.load()
+    return LOADS, "loads/s", True
+
+
+def bench_load_large() -> tuple:
+    """Loads a large synthetic level from a temporary file"""
+    level = synthetic_level(LARGE_SIZE)
+    with tempfile.TemporaryDirectory() as directory:
+        level.filepath = os.path.join(directory, "level.lvl")
+        level.save()
+        for _ in range(LARGE_LOADS):
+            level.load()
+            level.get_board()
+    return LARGE_LOADS, "loads/s", True
+
+
+def bench_save(filepath: str) -> tuple:
+    """Saves a level to a temporary file"""
+    level = load_level(filepath)
+    with tempfile.TemporaryDirectory() as directory:
+        level.filepath = os.path.join(directory, "level.lvl")
+        for _ in range(LOADS):
+            level.save()
+    return LOADS, "saves/s", True
+
+
+def bench_render(get_level, full: bool) -> tuple:
+    """Renders a level under the dummy video driver, from scratch or while the player walks randomly"""
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
+    import pygame
+    from renderer import LevelRenderer, get_img_size, get_view_shape
+    pygame.display.init()
+    try:
+        level = get_level()
+        img_size = get_img_size()
+        cols, rows = get_view_shape(level.matrix.shape)
+        display_surf = pygame.display.set_mode((img_size * cols, img_size * rows))
+        renderer = LevelRenderer(display_surf)
+        for action in random_actions(FRAMES):
+            if full:
+                renderer.matrix = None
+            else:
+                level.game_status = level.game_status.handle_action(action, level.matrix)
+            renderer.render(level)
+    finally:
+        pygame.display.quit()
+    return FRAMES, "frames/s", True
+
+
+def get_benchmarks() -> dict:
+    """Gets the benchmarks by their names, every benchmark returns the count of operations, their unit and whether
+    it completed"""
+    benchmarks = {}
+    for directory in LEVEL_DIRECTORIES:
+        for filepath in sorted(str(f) for f in Path(directory).iterdir() if f.is_file() and f.suffix == ".lvl"):
+            name = Path(filepath).stem
+            benchmarks["solve:" + name] = lambda filepath=filepath: bench_solve(lambda: load_level(filepath), "push")
+    for size in SYNTHETIC_SIZES:
+        benchmarks["solve:synthetic" + str(size)] = lambda size=size: bench_solve(lambda: synthetic_level(size),
+                                                                                  "push")
+    for name in ["tutorial", "level1"]:
+        filepath = "./levels/" + name + ".lvl"
+        benchmarks["bfs:" + name] = lambda filepath=filepath: bench_solve(lambda: load_level(filepath), "bfs")
+    for name in ["level1", "level3"]:
+        filepath = "./levels/" + name + ".lvl"
+        benchmarks["batch:" + name] = lambda filepath=filepath: bench_solve(lambda: load_level(filepath), "batch")
+    benchmarks["bfs:synthetic12"] = lambda: bench_solve(lambda: synthetic_level(12), "bfs")
+    benchmarks["batch:synthetic12"] = lambda: bench_solve(lambda: synthetic_level(12), "batch")
+    filepath = "./levels/level3.lvl"
+    benchmarks["transitions:game_status"] = lambda: bench_game_status(filepath)
+    benchmarks["transitions:packed"] = lambda: bench_packed_status(filepath)
+    benchmarks["hash_eq:game_status"] = lambda: bench_hash_eq(filepath)
+    benchmarks["io:load"] = lambda: bench_load(filepath)
+    benchmarks["io:save"] = lambda: bench_save(filepath)
+    benchmarks["io:load_large"] = bench_load_large
+    benchmarks["render:full"] = lambda: bench_render(lambda: load_level(filepath), True)
+    benchmarks["render:moves"] = lambda: bench_render(lambda: load_level(filepath), False)
+    benchmarks["render:large"] = lambda: bench_render(lambda: synthetic_level(LARGE_SIZE), False)
+    return benchmarks
+
+
+def _on_timer(signum, frame):
+    raise BenchmarkTimeout()
+
+
+def run_benchmark(name: str, time_budget: float = 0) -> dict:
+    """Runs a benchmark in the current process, stopping it after time_budget seconds if the platform allows it"""
+    benchmark = get_benchmarks()[name]
+    result = {"name": name, "count": None, "unit": None, "rate": None, "time": None, "peak_kib": None,
+              "complete": False, "error": None}
+    if time_budget > 0 and TIMER is not None:
+        signal.signal(signal.SIGALRM, _on_timer)
+        signal.setitimer(TIMER, time_budget)
+    start = time.perf_counter()
+    try:
+        result["count"], result["unit"], result["complete"] = benchmark()
+    except BenchmarkTimeout:
+        result["error"] = "Time budget exceeded"
+    except Exception as e:
+        result["error"] = "An unexpected error occurred: " + str(e)
+    finally:
+        if time_budget > 0 and TIMER is not None:
+            signal.setitimer(TIMER, 0)
+    elapsed = time.perf_counter() - start
+    result["time"] = round(elapsed, 3)
+    if result["count"] is not None and elapsed > 0:
+        result["rate"] = round(result["count"] / elapsed, 1)
+    if resource is not None:
+        # kibibytes on Linux
+        result["peak_kib"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return result
+
+
+def _worker(connection, name: str, time_budget: float):
+    """Runs a benchmark in a child process, so that its peak memory is its own"""
+    connection.send(run_benchmark(name, time_budget))
+    connection.close()
+
+
+def run_benchmarks(names: list, time_budget: float = 10) -> dict:
+    """Runs the benchmarks one after another, each in a fresh process, returns their results by name"""
+    results = {}
+    for name in names:
+        receiver, sender = multiprocessing.Pipe(False)
+        process = multiprocessing.Process(target=_worker, args=(sender, name, time_budget), daemon=True)
+        process.start()
+        sender.close()
+        # the budget is enforced in the child, the parent only steps in if the child does not stop
+        if receiver.poll(None if time_budget <= 0 else time_budget * 2 + 5):
+            try:
+                results[name] = receiver.recv()
+            except EOFError:
+                results[name] = {"name": name, "error": "Worker exited with code " + str(process.exitcode)}
+        else:
+            process.terminate()
+            results[name] = {"name": name, "error": "Time budget exceeded"}
+        process.join()
+        receiver.close()
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float = 0.25) -> list:
+    """Compares the rates to the baseline, returns the names of benchmarks slower by more than tolerance"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None or base.get("rate") is None or result.get("rate") is None:
+            continue
+        if result["rate"] < base["rate"] * (1 - tolerance):
+            regressions.append(name)
+    return regressions
+
+
+def format_table(results: dict, baseline: dict = None) -> str:
+    """Formats the results as a text table, with the rate relative to the baseline if given"""
+    header = ("Benchmark", "Rate", "Unit", "Time [s]", "Peak [MiB]", "Baseline", "Note")
+    rows = []
+    for name, result in results.items():
+        base = (baseline or {}).get(name, {})
+        ratio = ""
+        if base.get("rate") and result.get("rate") is not None:
+            ratio = format(result["rate"] / base["rate"], ".2f") + "x"
+        peak = "" if result.get("peak_kib") is None else format(result["peak_kib"] / 1024, ".1f")
+        note = result.get("error") or ("" if result.get("complete") else "incomplete")
+        rows.append((name, "" if result.get("rate") is None else str(result["rate"]), result.get("unit") or "",
+                     "" if result.get("time") is None else str(result["time"]), peak, ratio, note))
+    widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+    return "\n".join("  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip()
+                     for row in [header] + rows)
+
+
+def load_baseline(filepath: str) -> dict:
+    """Loads the results stored in a baseline file"""
+    with open(filepath, 'r', encoding="utf-8") as file:
+        return json.load(file)["results"]
+
+
+def save_baseline(filepath: str, results: dict, time_budget: float):
+    """Stores the results together with the platform they were measured on"""
+    with open(filepath, 'w', encoding="utf-8") as file:
+        json.dump({"python": platform.python_version(), "platform": platform.platform(),
+                   "processor": platform.processor(), "time_budget": time_budget, "results": results}, file, indent=2)
+        file.write("\n")
+
+
+def main():
+    """Entry function"""
+    parser = argparse.ArgumentParser(description="Benchmarks the solver, state transitions, level I/O and rendering")
+    parser.add_argument("-k", "--filter", default="", help="run only benchmarks whose name contains the text")
+    parser.add_argument("-t", "--time-limit", type=float, default=10, help="seconds per benchmark, 0 for no limit")
+    parser.add_argument("-b", "--baseline", default=DEFAULT_BASELINE, help="baseline file to compare against")
+    parser.add_argument("-s", "--save", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("-r", "--tolerance", type=float, default=0.25, help="allowed slowdown against the baseline")
+    parser.add_argument("-l", "--list", action="store_true", help="list the benchmarks and exit")
+    args = parser.parse_args()
+
+    names = [name for name in get_benchmarks() if args.filter in name]
+    if args.list:
+        print("\n".join(names))
+        return
+    results = run_benchmarks(names, args.time_limit)
+    if args.save:
+        save_baseline(args.baseline, results, args.time_limit)
+        print(format_table(results))
+        return
+    try:
+        baseline = load_baseline(args.baseline)
+    except (OSError, ValueError, KeyError):
+        baseline = {}
+    print(format_table(results, baseline))
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print("Slower than the baseline: " + ", ".join(regressions))
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
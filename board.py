@@ -0,0 +1,134 @@
+"""Class that precomputes the flat cell layout of a level matrix, used for fast state handling"""
+
+import numpy as np
+
+import constants as const
+from action import Action
+from game_status import GameStatus, PackedStatus
+
+MOVE_ACTIONS = (Action.MOVE_UP, Action.MOVE_RIGHT, Action.MOVE_DOWN, Action.MOVE_LEFT)
+# cells of a board from which walks are searched with arrays, a layer of cells at once
+ARRAY_WALK_SIZE = 2048
+
+
+def iter_cells(mask: int):
+    """Yields the flat cell indices set in a bitmask"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class Board:
+    """Flat cell layout of a level matrix padded by a border of walls, so that no move can leave the board"""
+
+    def __init__(self, matrix: np.ndarray):
+        self.shape = matrix.shape
+        self.stride = matrix.shape[1] + 2
+        padded = np.pad(matrix, 1, mode='constant', constant_values=const.WALL)
+        # identifies boards with the same walls and destinations, used to reuse tables computed for a board
+        self.key = (matrix.shape, padded.astype(np.uint8).tobytes())
+        self.size = padded.size
+        self.wall_array = padded.ravel() == const.WALL
+        self.walls = self.wall_array.tolist()
+        # offsets in the order of MOVE_ACTIONS
+        self.offsets = (-1, self.stride, 1, -self.stride)
+        self.offset_array = np.array(self.offsets, np.intp)
+        # bit i of the little-endian bytes is cell i
+        dests = np.packbits(padded.ravel() == const.DESTINATION, bitorder="little")
+        self.dest_mask = int.from_bytes(dests.tobytes(), "little")
+
+    def get_offset(self, action: Action) -> int:
+        """Gets the flat offset of a move action, 0 for any other action"""
+        for move_action, offset in zip(MOVE_ACTIONS, self.offsets):
+            if action == move_action:
+                return offset
+        return 0
+
+    def index(self, col: int, row: int) -> int:
+        """Converts a matrix position to a flat cell index"""
+        return (int(col) + 1) * self.stride + int(row) + 1
+
+    def position(self, index: int) -> (int, int):
+        """Converts a flat cell index to a matrix position"""
+        col, row = divmod(index, self.stride)
+        return col - 1, row - 1
+
+    def pack(self, game_status: GameStatus) -> PackedStatus:
+        """Converts a GameStatus to a PackedStatus"""
+        boxes = 0
+        for box in game_status.box_pos:
+            boxes |= 1 << self.index(*box)
+        return PackedStatus(self.index(*game_status.player_pos), boxes)
+
+    def unpack(self, packed: PackedStatus) -> GameStatus:
+        """Converts a PackedStatus to a GameStatus"""
+        box_pos = {self.position(box) for box in iter_cells(packed.boxes)}
+        return GameStatus(np.array(self.position(packed.player), const.POSITION), box_pos)
+
+    def is_win(self, packed: PackedStatus) -> bool:
+        """Check that packed status is winning"""
+        return packed.boxes == self.dest_mask
+
+    def walk_array(self, player: int, boxes: int) -> np.ndarray:
+        """Counts the walking distance from the player to every cell, -1 for the cells the player cannot reach without
+        pushing a box, a whole layer of cells at once"""
+        distances = np.full(self.size, -1, np.int32)
+        blocked = self.wall_array.copy()
+        blocked[np.fromiter(iter_cells(boxes), np.intp)] = True
+        blocked[player] = True
+        distances[player] = 0
+        frontier = np.array([player], np.intp)
+        depth = 0
+        while frontier.size:
+            depth += 1
+            neighbours = (frontier[:, None] + self.offset_array).ravel()
+            frontier = np.unique(neighbours[~blocked[neighbours]])
+            blocked[frontier] = True
+            distances[frontier] = depth
+        return distances
+
+    def walk_distances(self, player: int, boxes: int) -> dict:
+        """Counts the walking distance from the player to every cell reachable without pushing a box"""
+        if self.size > ARRAY_WALK_SIZE:
+            distances = self.walk_array(player, boxes)
+            cells = np.flatnonzero(distances >= 0)
+            return dict(zip(cells.tolist(), distances[cells].tolist()))
+        walls = self.walls
+        box_cells = set(iter_cells(boxes))
+        distances = {player: 0}
+        queue = [player]
+        for cell in queue:
+            distance = distances[cell] + 1
+            for offset in self.offsets:
+                neighbour = cell + offset
+                if walls[neighbour] or neighbour in box_cells or neighbour in distances:
+                    continue
+                distances[neighbour] = distance
+                queue.append(neighbour)
+        return distances
+
+    def walk_path(self, player: int, goal: int, boxes: int) -> list:
+        """Finds the shortest walk from the player to the goal without pushing a box, as indices of offsets"""
+        walls = self.walls
+        box_cells = set(iter_cells(boxes))
+        came_from = {player: None}
+        queue = [player]
+        for cell in queue:
+            if cell == goal:
+                break
+            for direction, offset in enumerate(self.offsets):
+                neighbour = cell + offset
+                if walls[neighbour] or neighbour in box_cells or neighbour in came_from:
+                    continue
+                came_from[neighbour] = (cell, direction)
+                queue.append(neighbour)
+        if goal not in came_from:
+            raise ValueError("Goal cannot be reached without pushing a box")
+        directions = []
+        cell = goal
+        while came_from[cell] is not None:
+            cell, direction = came_from[cell]
+            directions.append(direction)
+        directions.reverse()
+        return directions
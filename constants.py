@@ -1,5 +1,12 @@
 """Definition of constants"""
 
+import numpy as np
+
 NOTHING = 0
 WALL = 1
 DESTINATION = 2
+
+# type of positions in levels, wide enough for levels of MAX_SIZE cells
+POSITION = np.int32
+# the largest width and height of a level in the editor
+MAX_SIZE = 1000
@@ -0,0 +1,170 @@
+"""Detection of dead positions, from which the level can no longer be solved, used to prune the solver"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+from board import Board, iter_cells
+
+CORRAL_NODE_LIMIT = 2000
+# count of boards whose dead square tables are kept
+TABLE_CACHE_SIZE = 16
+
+_dead_squares = OrderedDict()
+
+
+def dead_squares(board: Board) -> list:
+    """Finds the cells from which a box can never reach any destination, by pulling boxes from destinations
+
+    The pulls are searched with arrays, a whole layer of cells at once."""
+    walls = board.wall_array
+    live = np.zeros(board.size, bool)
+    frontier = np.fromiter(iter_cells(board.dest_mask), np.intp)
+    live[frontier] = True
+    while frontier.size:
+        pulled = []
+        for offset in board.offsets:
+            # pulling the box from cell to prev_cell needs the player to step back to prev_cell - offset
+            prev_cells = frontier - offset
+            prev_cells = prev_cells[~walls[prev_cells] & ~live[prev_cells]]
+            prev_cells = prev_cells[~walls[prev_cells - offset]]
+            live[prev_cells] = True
+            pulled.append(prev_cells)
+        frontier = np.concatenate(pulled)
+    return (~walls & ~live).tolist()
+
+
+def get_dead_squares(board: Board) -> list:
+    """Gets the dead square table of a board, reused for the recent boards with the same walls and destinations"""
+    if board.key in _dead_squares:
+        _dead_squares.move_to_end(board.key)
+        return _dead_squares[board.key]
+    dead = dead_squares(board)
+    _dead_squares[board.key] = dead
+    if len(_dead_squares) > TABLE_CACHE_SIZE:
+        _dead_squares.popitem(last=False)
+    return dead
+
+
+class DeadlockDetector:
+    """Checks whether a position is dead, with a dead square table precomputed for the board
+
+    If stats are given, every dead position found is counted into them by its reason."""
+
+    def __init__(self, board: Board, corrals: bool = False, stats=None):
+        self.board = board
+        self.stats = stats
+        self.dead = get_dead_squares(board)
+        self.corrals = corrals
+        # offsets of the two axes, vertical then horizontal
+        self.axes = (board.offsets[2], board.offsets[1])
+
+    def is_dead_push(self, boxes: int, box: int) -> bool:
+        """Checks whether the box that was just pushed to the cell box causes a dead position"""
+        if self.dead[box]:
+            if self.stats is not None:
+                self.stats.prune("dead square")
+            return True
+        if self.is_freeze_deadlock(boxes, box):
+            if self.stats is not None:
+                self.stats.prune("freeze")
+            return True
+        return False
+
+    def is_freeze_deadlock(self, boxes: int, box: int) -> bool:
+        """Checks whether the box, or a box frozen together with it, can never move again while off a destination"""
+        frozen = set()
+        if not (self._is_blocked(boxes, box, 0, frozen, {box}) and self._is_blocked(boxes, box, 1, frozen, {box})):
+            return False
+        frozen.add(box)
+        return any(not self.board.dest_mask >> frozen_box & 1 for frozen_box in frozen)
+
+    def _is_blocked(self, boxes: int, box: int, axis: int, frozen: set, as_walls: set) -> bool:
+        """Checks whether the box can never move along the axis, the boxes in as_walls are treated as walls"""
+        walls = self.board.walls
+        offset = self.axes[axis]
+        neighbours = (box - offset, box + offset)
+        if any(walls[cell] or cell in as_walls for cell in neighbours):
+            return True
+        if self.dead[neighbours[0]] and self.dead[neighbours[1]]:
+            return True
+        for cell in neighbours:
+            if not boxes >> cell & 1:
+                continue
+            # the neighbouring box blocks this axis while it cannot move along the other one
+            if self._is_blocked(boxes, cell, 1 - axis, frozen, as_walls | {box}):
+                frozen.add(cell)
+                return True
+        return False
+
+    def is_corral_deadlock(self, reachable, boxes: int) -> bool:
+        """Checks whether some area the player cannot reach can never be opened nor solved
+
+        Only the boxes inside and around the area are kept, which can only make the level easier, and a bounded
+        push search checks whether the player can get into the area or put all those boxes on destinations."""
+        if not self.corrals:
+            return False
+        board = self.board
+        box_cells = set(iter_cells(boxes))
+        seen = set(reachable)
+        # the floor cells the player cannot reach, found without a loop over every cell
+        free = ~board.wall_array
+        free[list(box_cells)] = False
+        free[list(reachable)] = False
+        for cell in np.flatnonzero(free).tolist():
+            if cell in seen:
+                continue
+            corral, corral_boxes = self._get_corral(cell, box_cells, seen)
+            if corral_boxes & ~board.dest_mask == 0:
+                continue
+            if not self._can_open_corral(next(iter(reachable)), corral_boxes, corral):
+                if self.stats is not None:
+                    self.stats.prune("corral")
+                return True
+        return False
+
+    def _get_corral(self, cell: int, box_cells: set, seen: set) -> (set, int):
+        """Floods an unreachable area, returns its cells and the bitmask of boxes inside and around it"""
+        walls = self.board.walls
+        corral = {cell}
+        corral_boxes = 0
+        queue = [cell]
+        for curr_cell in queue:
+            for offset in self.board.offsets:
+                neighbour = curr_cell + offset
+                if walls[neighbour] or neighbour in corral:
+                    continue
+                if neighbour in box_cells:
+                    corral_boxes |= 1 << neighbour
+                    continue
+                corral.add(neighbour)
+                queue.append(neighbour)
+        seen.update(corral)
+        return corral, corral_boxes
+
+    def _can_open_corral(self, player: int, boxes: int, corral: set) -> bool:
+        """Bounded search whether the player can enter the corral or solve its boxes, True if the limit is hit"""
+        board = self.board
+        walls = board.walls
+        visited = {(player, boxes)}
+        queue = [(player, boxes)]
+        for curr_player, curr_boxes in queue:
+            if len(visited) > CORRAL_NODE_LIMIT:
+                return True
+            if curr_boxes & ~board.dest_mask == 0:
+                return True
+            reachable = board.walk_distances(curr_player, curr_boxes)
+            if any(cell in corral for cell in reachable):
+                return True
+            for box in iter_cells(curr_boxes):
+                for offset in board.offsets:
+                    target = box + offset
+                    if box - offset not in reachable or walls[target] or curr_boxes >> target & 1:
+                        continue
+                    if self.dead[target]:
+                        continue
+                    state = (box, curr_boxes ^ (1 << box) | (1 << target))
+                    if state not in visited:
+                        visited.add(state)
+                        queue.append(state)
+        return False
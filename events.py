@@ -0,0 +1,93 @@
+"""Event loop that blocks on input instead of polling and runs background jobs between frames"""
+
+import time
+from collections import deque
+
+import pygame
+from pygame.locals import *
+
+from action import Action
+
+DEFAULT_FPS = 30
+
+
+def event_to_action(event) -> Action:
+    """Converts a pygame event to an action"""
+    if event.type == QUIT:
+        return Action.EXIT
+    if event.type == KEYDOWN:
+        if event.key == K_ESCAPE:
+            return Action.EXIT
+        if event.key in [K_RETURN, K_KP_ENTER]:
+            return Action.ENTER
+        if event.key == K_r:
+            return Action.RESET
+        if event.key == K_h:
+            return Action.HINT
+        if event.key in [K_z, K_u]:
+            return Action.UNDO
+        if event.key == K_y:
+            return Action.REDO
+        if event.key == K_UP:
+            return Action.MOVE_UP
+        if event.key == K_RIGHT:
+            return Action.MOVE_RIGHT
+        if event.key == K_DOWN:
+            return Action.MOVE_DOWN
+        if event.key == K_LEFT:
+            return Action.MOVE_LEFT
+    return Action.NOTHING
+
+
+class EventLoop:
+    """Waits for pygame events, blocking while there is nothing to do
+
+    Jobs are callables that do a small step of work and return True once they are finished. While any job is
+    pending, every job runs once per frame and the loop sleeps until the next event or the end of the frame."""
+
+    def __init__(self, fps: int = DEFAULT_FPS):
+        self.fps = fps
+        self.jobs = []
+        self.pending = deque()
+
+    def add_job(self, job):
+        """Adds a job that is run between frames until it returns True"""
+        self.jobs.append(job)
+
+    def cancel_job(self, job):
+        """Stops running a job"""
+        if job in self.jobs:
+            self.jobs.remove(job)
+
+    def run_jobs(self):
+        """Runs one step of every job"""
+        for job in list(self.jobs):
+            if job():
+                self.cancel_job(job)
+
+    def wait(self) -> list:
+        """Waits for events, returns an empty list after a frame of jobs without any input"""
+        if self.pending:
+            events = list(self.pending)
+            self.pending.clear()
+            return events
+        if not self.jobs:
+            return [pygame.event.wait()] + pygame.event.get()
+        started = time.perf_counter()
+        self.run_jobs()
+        # pygame waits forever with a timeout of 0
+        timeout = max(1, int((started + 1 / self.fps - time.perf_counter()) * 1000))
+        event = pygame.event.wait(timeout)
+        if event.type == NOEVENT:
+            return []
+        return [event] + pygame.event.get()
+
+    def get_action(self) -> Action:
+        """Waits for the next action, Action.NOTHING if a frame of jobs passed or the events had no action"""
+        events = self.wait()
+        for i, event in enumerate(events):
+            action = event_to_action(event)
+            if action != Action.NOTHING:
+                self.pending.extend(events[i + 1:])
+                return action
+        return Action.NOTHING
@@ -0,0 +1,36 @@
+"""Registry of fonts with a cache of rendered text surfaces"""
+
+from collections import OrderedDict
+
+import pygame
+from pygame.surface import Surface
+
+
+class FontRegistry:
+    """Loads every font size once and keeps the most recently rendered text surfaces"""
+
+    def __init__(self, max_surfaces: int = 256):
+        self.fonts = {}
+        self.surfaces = OrderedDict()
+        self.max_surfaces = max_surfaces
+
+    def get_font(self, size: int) -> pygame.font.Font:
+        """Gets the default font of a size"""
+        if size not in self.fonts:
+            self.fonts[size] = pygame.font.SysFont(pygame.font.get_default_font(), size)
+        return self.fonts[size]
+
+    def render(self, string: str, size: int, colour: (int, int, int) = (255, 255, 255)) -> Surface:
+        """Renders a text, or gets it from the cache if it was rendered recently"""
+        key = (string, size, colour)
+        if key in self.surfaces:
+            self.surfaces.move_to_end(key)
+            return self.surfaces[key]
+        surface = self.get_font(size).render(string, True, colour)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_surfaces:
+            self.surfaces.popitem(last=False)
+        return surface
+
+
+FONTS = FontRegistry()
@@ -0,0 +1,69 @@
+"""Arrays of search states for the batched engine, packed into fixed size keys kept in a set of sorted arrays"""
+
+import numpy as np
+
+from board import Board
+
+
+class StateCodec:
+    """Packs states given as arrays of player cells and sorted box cells of a board into keys
+
+    Cells are numbered among the cells that are not walls, every field of a key has the bits of the largest number.
+    Keys of one 64-bit word are integers, longer keys are raw bytes, both can be sorted and compared."""
+
+    def __init__(self, board: Board, box_count: int):
+        floor = ~np.array(board.walls)
+        self.numbers = (np.cumsum(floor) - 1).astype(np.uint64)
+        self.bits = max(int(floor.sum()) - 1, 1).bit_length()
+        self.per_word = 64 // self.bits
+        self.words = -(-(box_count + 1) // self.per_word)
+
+    @property
+    def key_bytes(self) -> int:
+        """Size of a key"""
+        return 8 * self.words
+
+    def encode(self, players: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+        """Packs the states, players has a cell per state and boxes a sorted row of cells per state"""
+        keys = np.zeros((len(players), self.words), np.uint64)
+        keys[:, 0] = self.numbers[players]
+        numbers = self.numbers[boxes]
+        for i in range(1, boxes.shape[1] + 1):
+            keys[:, i // self.per_word] |= numbers[:, i - 1] << np.uint64(i % self.per_word * self.bits)
+        if self.words == 1:
+            return keys[:, 0]
+        return keys.view("V" + str(self.key_bytes)).ravel()
+
+
+class KeySet:
+    """Set of keys in sorted arrays of decreasing sizes, merged like the digits of a binary counter
+
+    A lookup searches every array, which keeps adding a batch of keys cheap even when the set is large."""
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    @property
+    def nbytes(self) -> int:
+        """Memory taken by the keys"""
+        return sum(chunk.nbytes for chunk in self.chunks)
+
+    def contains(self, keys: np.ndarray) -> np.ndarray:
+        """Checks which of the keys are in the set"""
+        found = np.zeros(len(keys), bool)
+        for chunk in self.chunks:
+            positions = np.searchsorted(chunk, keys)
+            positions[positions == len(chunk)] = 0
+            found |= chunk[positions] == keys
+        return found
+
+    def add(self, keys: np.ndarray):
+        """Adds keys that are unique and not in the set yet"""
+        if len(keys) == 0:
+            return
+        self.chunks.append(np.sort(keys))
+        self.size += len(keys)
+        while len(self.chunks) > 1 and len(self.chunks[-2]) <= 2 * len(self.chunks[-1]):
+            last = self.chunks.pop()
+            self.chunks[-1] = np.sort(np.concatenate((self.chunks[-1], last)))
@@ -26,7 +26,7 @@ class GameStatus:
 
     def handle_action(self, action: Action, matrix: np.array):
         """Handles a move action"""
-        move_vec = np.zeros((2), np.int8)
+        move_vec = np.zeros((2), const.POSITION)
         if action == action.MOVE_UP:
             # y--
             move_vec[1] -= 1
@@ -70,3 +70,52 @@ class GameStatus:
 
     def __ne__(self, other: object) -> bool:
         return not self == other
+
+
+class PackedStatus:
+    """Compact game status, the player is a flat cell index and the boxes are a bitmask of flat cell indices"""
+
+    __slots__ = ("player", "boxes")
+
+    def __init__(self, player: int, boxes: int):
+        self.player = player
+        self.boxes = boxes
+
+    def handle_action(self, action: Action, board):
+        """Handles a move action on a Board, returns itself if the move is not possible"""
+        offset = board.get_offset(action)
+        if offset == 0:
+            return self
+        return self.move(offset, board.walls)
+
+    def move(self, offset: int, walls) -> "PackedStatus":
+        """Moves the player by a flat offset, returns itself if the move is not possible"""
+        new_player = self.player + offset
+        if walls[new_player]:
+            return self
+        if not self.boxes >> new_player & 1:
+            return PackedStatus(new_player, self.boxes)
+        new_box = new_player + offset
+        if walls[new_box] or self.boxes >> new_box & 1:
+            return self
+        return PackedStatus(new_player, self.boxes ^ (1 << new_player) | (1 << new_box))
+
+    def unmove(self, offset: int, walls) -> tuple:
+        """Finds the statuses that get to this one by moving the player by a flat offset, pulling back a pushed box"""
+        prev_player = self.player - offset
+        if walls[prev_player] or self.boxes >> prev_player & 1:
+            return ()
+        walked = PackedStatus(prev_player, self.boxes)
+        box = self.player + offset
+        if not self.boxes >> box & 1:
+            return (walked,)
+        return walked, PackedStatus(prev_player, self.boxes ^ (1 << box) | (1 << self.player))
+
+    def __hash__(self) -> int:
+        return hash((self.player, self.boxes))
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, PackedStatus) and self.player == other.player and self.boxes == other.boxes
+
+    def __ne__(self, other: object) -> bool:
+        return not self == other
@@ -0,0 +1,288 @@
+"""Generator of new levels, carves rooms, places destinations and pulls the boxes away from them to find a start
+
+Every status reached by pulling boxes back from the solved status is solvable, the count of pulls of the breadth first
+search is the optimal count of pushes. The optimal count of moves is then found by the anytime solver."""
+
+import argparse
+import multiprocessing
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+import constants as const
+from board import Board, iter_cells
+from game_status import PackedStatus
+from level import Level
+from pack import write_pack
+import solver
+
+# largest width or height of a carved room
+ROOM_SIZE = 5
+# cells of the level per carved room
+ROOM_AREA = 20
+# levels carved until one has a start with enough pushes
+MAX_ATTEMPTS = 20
+# statuses of the pull search expanded per level
+PULL_STATE_LIMIT = 50000
+# seconds the solver looks for the optimal count of moves of a generated level
+SOLVE_TIME_LIMIT = 10
+METRICS = ("pushes", "moves")
+
+
+def carve_rooms(shape: (int, int), rooms: int, rng: np.random.Generator) -> np.ndarray:
+    """Carves rectangular rooms into a matrix full of walls, each room is joined to the previous one by a corridor
+
+    The border of the matrix stays a wall."""
+    cols, rows = shape
+    if cols < 4 or rows < 4:
+        raise ValueError("Level is too small to generate")
+    matrix = np.full(shape, const.WALL, np.uint8)
+    previous = None
+    for _ in range(rooms):
+        width = int(rng.integers(2, min(ROOM_SIZE, cols - 2) + 1))
+        height = int(rng.integers(2, min(ROOM_SIZE, rows - 2) + 1))
+        col = int(rng.integers(1, cols - width))
+        row = int(rng.integers(1, rows - height))
+        matrix[col:col + width, row:row + height] = const.NOTHING
+        center = (col + width // 2, row + height // 2)
+        if previous is not None:
+            # along the row of the previous room, then along the column of this one
+            first, last = sorted((previous[0], center[0]))
+            matrix[first:last + 1, previous[1]] = const.NOTHING
+            first, last = sorted((previous[1], center[1]))
+            matrix[center[0], first:last + 1] = const.NOTHING
+        previous = center
+    return matrix
+
+
+def place_goals(matrix: np.ndarray, box_count: int, rng: np.random.Generator):
+    """Turns randomly chosen floor cells into destinations, one more floor cell is left for the player"""
+    floor = np.argwhere(matrix == const.NOTHING)
+    if len(floor) <= box_count:
+        raise ValueError("Level has not enough floor for the boxes")
+    goals = floor[rng.choice(len(floor), box_count, replace=False)]
+    matrix[tuple(goals.T)] = const.DESTINATION
+
+
+def pull_search(board: Board, max_depth: int, state_limit: int = PULL_STATE_LIMIT,
+                stats: solver.SolverStats = None) -> list:
+    """Breadth first search pulling boxes from every solved status, returns the layers of statuses by count of pulls
+
+    Statuses are grouped by the player's reachable region, a status is kept in the first layer it is reached in, so
+    its layer is its optimal count of pushes. The search stops after the layer max_depth or after the layer in which
+    state_limit statuses are expanded."""
+    if stats is None:
+        stats = solver.SolverStats()
+    stats.start()
+    walls = board.walls
+    # the cells of the regions expanded with the same boxes
+    regions = {}
+    expanded = 0
+    layers = []
+    layer = [PackedStatus(cell, board.dest_mask) for cell in range(board.size)
+             if not walls[cell] and not board.dest_mask >> cell & 1]
+    while layer and len(layers) <= max_depth and expanded < state_limit:
+        kept = []
+        next_layer = {}
+        for status in layer:
+            region = regions.setdefault(status.boxes, set())
+            if status.player in region:
+                stats.duplicates += 1
+                continue
+            distances = board.walk_distances(status.player, status.boxes)
+            region.update(distances)
+            kept.append(status)
+            expanded += 1
+            stats.expand(expanded)
+            for box in iter_cells(status.boxes):
+                for offset in board.offsets:
+                    # the player stands next to the box and steps back, the box follows
+                    player = box + offset
+                    target = player + offset
+                    if player not in distances or walls[target] or status.boxes >> target & 1:
+                        continue
+                    to_visit = PackedStatus(target, status.boxes ^ (1 << box) | (1 << player))
+                    if to_visit not in next_layer:
+                        next_layer[to_visit] = None
+                        stats.generate(len(layers) + 1)
+        if not kept:
+            break
+        layers.append(kept)
+        layer = list(next_layer)
+    stats.finish(len(layers) - 1)
+    return layers
+
+
+def create_level(board: Board, matrix: np.ndarray, status: PackedStatus) -> Level:
+    """Creates a level of the generated matrix starting at a status found by the pull search"""
+    return Level(False, matrix=matrix, game_status=board.unpack(status), cache=None)
+
+
+def solve_moves(level: Level, time_limit: float) -> dict:
+    """Finds the optimal count of moves of a generated level, or the best one found within the time limit"""
+    report = level.solve_anytime(time_limit)
+    return {"moves": report["moves"], "proven": report["proven"]}
+
+
+def generate_level(shape: (int, int), box_count: int, target: int, metric: str = "pushes", seed: int = None,
+                   time_limit: float = SOLVE_TIME_LIMIT, tolerance: int = 0) -> (Level, dict):
+    """Generates a solvable level with the count of pushes or moves of its optimal solution closest to target
+
+    Up to MAX_ATTEMPTS levels are carved until one has a start within tolerance of target, the closest one is returned
+    with a report of its optimal counts of pushes and moves, whether the count of moves is proven and the seed."""
+    if metric not in METRICS:
+        raise ValueError("Unknown metric " + metric)
+    if box_count < 1 or target < 1:
+        raise ValueError("Level needs at least one box and one push")
+    rng = np.random.default_rng(seed)
+    rooms = max(2, shape[0] * shape[1] // ROOM_AREA)
+    best = None
+    for _ in range(MAX_ATTEMPTS):
+        matrix = carve_rooms(shape, rooms, rng)
+        try:
+            place_goals(matrix, box_count, rng)
+        except ValueError:
+            continue
+        board = Board(matrix)
+        layers = pull_search(board, target)
+        # the first layer holds the solved statuses
+        depth = min(target, len(layers) - 1)
+        if depth == 0:
+            continue
+        if metric == "pushes":
+            layer = layers[depth]
+            level = create_level(board, matrix, layer[int(rng.integers(len(layer)))])
+            report = {"pushes": depth, **solve_moves(level, time_limit)}
+            score = abs(depth - target)
+        else:
+            # the count of moves grows with the count of pushes, so a start of one layer is solved per step of a
+            # binary search over the layers, every move is at most one push so deeper layers are not tried
+            level, report, score = None, None, None
+            low, high = 1, depth
+            while low <= high:
+                pushes = (low + high) // 2
+                layer = layers[pushes]
+                candidate = create_level(board, matrix, layer[int(rng.integers(len(layer)))])
+                candidate_report = {"pushes": pushes, **solve_moves(candidate, time_limit)}
+                moves = candidate_report["moves"]
+                if moves != -1 and (score is None or abs(moves - target) < score):
+                    level, report, score = candidate, candidate_report, abs(moves - target)
+                if moves == -1 or moves > target:
+                    high = pushes - 1
+                elif moves < target:
+                    low = pushes + 1
+                else:
+                    break
+        if score is None:
+            continue
+        if best is None or score < best[2]:
+            best = (level, report, score)
+        if score <= tolerance:
+            break
+    if best is None:
+        raise ValueError("No level with a box that can be pushed was generated")
+    level, report, _ = best
+    report.update(seed=seed, cols=shape[0], rows=shape[1], boxes=box_count)
+    return level, report
+
+
+def _generate(args: tuple) -> dict:
+    """Generates a level in a worker process of the pool, returns its report with the text of the level"""
+    started = time.perf_counter()
+    shape, box_count, target, metric, seed, time_limit, tolerance = args
+    try:
+        level, report = generate_level(shape, box_count, target, metric, seed, time_limit, tolerance)
+        report.update(text=level.serialize(), error=None)
+    except ValueError as e:
+        report = {"seed": seed, "text": None, "error": str(e)}
+    report["time"] = round(time.perf_counter() - started, 3)
+    return report
+
+
+def get_rank(report: dict) -> tuple:
+    """Sort key of generated levels from the easiest, levels without a known count of moves follow and failed levels
+    are last"""
+    if report["error"] is not None:
+        return 2, 0, 0, report["seed"]
+    if report["moves"] == -1:
+        return 1, report["pushes"], 0, report["seed"]
+    return 0, report["moves"], report["pushes"], report["seed"]
+
+
+def generate_levels(count: int, shape: (int, int), box_count: int, target: int, metric: str = "pushes",
+                    jobs: int = 1, seed: int = 0, time_limit: float = SOLVE_TIME_LIMIT, tolerance: int = 0) -> list:
+    """Generates count levels with the seeds from seed on, in a pool of jobs processes if jobs is more than 1
+
+    Returns the reports ranked from the easiest level, each with the text of its level."""
+    tasks = [(shape, box_count, target, metric, seed + i, time_limit, tolerance) for i in range(count)]
+    if jobs <= 1 or count < 2:
+        reports = [_generate(task) for task in tasks]
+    else:
+        with multiprocessing.Pool(jobs) as pool:
+            reports = pool.map(_generate, tasks, 1)
+    return sorted(reports, key=get_rank)
+
+
+def get_title(report: dict) -> str:
+    """Gets the name of a generated level"""
+    return "Generated " + str(report["seed"]) + " (" + str(report["moves"]) + " moves, " + \
+        str(report["pushes"]) + " pushes)"
+
+
+def save_levels(reports: list, directory: str) -> list:
+    """Saves the generated levels as .lvl files into a directory, returns their paths"""
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    filepaths = []
+    for report in reports:
+        if report["error"] is not None:
+            continue
+        level = Level(False, cache=None)
+        level.parse(report["text"].splitlines())
+        level.filepath = str(Path(directory) / ("generated_" + str(report["seed"]) + ".lvl"))
+        level.save()
+        filepaths.append(level.filepath)
+    return filepaths
+
+
+def save_pack(reports: list, filepath: str):
+    """Saves the generated levels into a pack, in the order of the reports"""
+    Path(filepath).parent.mkdir(parents=True, exist_ok=True)
+    write_pack(filepath, [(get_title(report), report["text"]) for report in reports if report["error"] is None])
+
+
+def main():
+    """Entry function"""
+    parser = argparse.ArgumentParser(description="Generates solvable levels and ranks them by difficulty")
+    parser.add_argument("output", help="directory for .lvl files, or a pack file ending with .xsb or .sok")
+    parser.add_argument("-n", "--count", type=int, default=10, help="number of levels")
+    parser.add_argument("-W", "--width", type=int, default=10, help="width of the levels")
+    parser.add_argument("-H", "--height", type=int, default=10, help="height of the levels")
+    parser.add_argument("-b", "--boxes", type=int, default=3, help="number of boxes")
+    parser.add_argument("-d", "--target", type=int, default=10, help="target optimal count of pushes or moves")
+    parser.add_argument("-m", "--metric", default="pushes", choices=METRICS, help="what the target counts")
+    parser.add_argument("-j", "--jobs", type=int, default=0, help="number of worker processes, all cores by default")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="seed of the first level")
+    parser.add_argument("-t", "--time-limit", type=float, default=SOLVE_TIME_LIMIT,
+                        help="seconds to prove the optimal count of moves of a level")
+    parser.add_argument("-r", "--tolerance", type=int, default=0, help="accepted difference from the target")
+    args = parser.parse_args()
+    if not 0 < args.width <= const.MAX_SIZE or not 0 < args.height <= const.MAX_SIZE:
+        parser.error("size must be from 1 to " + str(const.MAX_SIZE))
+
+    jobs = args.jobs if args.jobs > 0 else multiprocessing.cpu_count()
+    reports = generate_levels(args.count, (args.width, args.height), args.boxes, args.target, args.metric, jobs,
+                              args.seed, args.time_limit, args.tolerance)
+    if args.output.lower().endswith((".xsb", ".sok")):
+        save_pack(reports, args.output)
+    else:
+        save_levels(reports, args.output)
+    for report in reports:
+        print(get_title(report) if report["error"] is None else
+              "Generated " + str(report["seed"]) + " failed: " + report["error"])
+    sys.exit(1 if any(report["error"] is not None for report in reports) else 0)
+
+
+if __name__ == "__main__":
+    main()
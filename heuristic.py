@@ -0,0 +1,138 @@
+"""Admissible heuristic for the solver based on a minimum cost assignment of boxes to destinations"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+from board import Board, iter_cells
+
+UNREACHABLE = 1 << 30
+# count of boards whose push distance tables are kept
+TABLE_CACHE_SIZE = 16
+
+_push_distances = OrderedDict()
+
+
+def push_distances(board: Board, goal: int) -> list:
+    """Counts the minimal number of pushes to get a box from every cell to the goal, ignoring other boxes
+
+    The pushes are searched backwards with arrays, a whole layer of cells at once."""
+    walls = board.wall_array
+    distances = np.full(board.size, UNREACHABLE, np.int64)
+    distances[goal] = 0
+    frontier = np.array([goal], np.intp)
+    depth = 0
+    while frontier.size:
+        depth += 1
+        found = []
+        for offset in board.offsets:
+            # the box came from prev_cell, pushed by a player standing behind it
+            prev_cells = frontier - offset
+            prev_cells = prev_cells[~walls[prev_cells] & (distances[prev_cells] == UNREACHABLE)]
+            prev_cells = prev_cells[~walls[prev_cells - offset]]
+            distances[prev_cells] = depth
+            found.append(prev_cells)
+        frontier = np.concatenate(found)
+    return distances.tolist()
+
+
+def get_push_distances(board: Board) -> list:
+    """Gets the push distances to every destination of a board, reused for the recent boards with the same walls and
+    destinations"""
+    if board.key in _push_distances:
+        _push_distances.move_to_end(board.key)
+        return _push_distances[board.key]
+    distances = [push_distances(board, goal) for goal in iter_cells(board.dest_mask)]
+    _push_distances[board.key] = distances
+    if len(_push_distances) > TABLE_CACHE_SIZE:
+        _push_distances.popitem(last=False)
+    return distances
+
+
+def min_matching(costs: list) -> int:
+    """Finds the minimal total cost of assigning rows to columns of a square matrix (Hungarian algorithm)"""
+    size = len(costs)
+    row_pot = [0] * (size + 1)
+    col_pot = [0] * (size + 1)
+    assigned = [0] * (size + 1)
+    way = [0] * (size + 1)
+    for row in range(1, size + 1):
+        assigned[0] = row
+        col = 0
+        min_slack = [float("inf")] * (size + 1)
+        used = [False] * (size + 1)
+        while assigned[col] != 0:
+            used[col] = True
+            curr_row = assigned[col]
+            delta = float("inf")
+            next_col = 0
+            for j in range(1, size + 1):
+                if used[j]:
+                    continue
+                slack = costs[curr_row - 1][j - 1] - row_pot[curr_row] - col_pot[j]
+                if slack < min_slack[j]:
+                    min_slack[j] = slack
+                    way[j] = col
+                if min_slack[j] < delta:
+                    delta = min_slack[j]
+                    next_col = j
+            for j in range(size + 1):
+                if used[j]:
+                    row_pot[assigned[j]] += delta
+                    col_pot[j] -= delta
+                else:
+                    min_slack[j] -= delta
+            col = next_col
+        while col != 0:
+            prev_col = way[col]
+            assigned[col] = assigned[prev_col]
+            col = prev_col
+    return -col_pot[0]
+
+
+class MatchingHeuristic:
+    """Lower bound of the remaining pushes, the cost of the best assignment of boxes to destinations
+
+    Results are cached per box bitmask, the cache is cleared whenever it holds max_entries, if set."""
+
+    def __init__(self, board: Board, max_entries: int = 0):
+        self.goals = list(iter_cells(board.dest_mask))
+        self.stride = board.stride
+        self.distances = get_push_distances(board)
+        self.cache = {}
+        self.max_entries = max_entries
+
+    def __call__(self, boxes: int):
+        """Gets the lower bound for a box bitmask, None if the boxes cannot be solved"""
+        if boxes in self.cache:
+            return self.cache[boxes]
+        if self.max_entries and len(self.cache) >= self.max_entries:
+            self.cache.clear()
+        costs = []
+        for box in iter_cells(boxes):
+            row = [distances[box] for distances in self.distances]
+            if min(row, default=UNREACHABLE) == UNREACHABLE:
+                self.cache[boxes] = None
+                return None
+            costs.append(row)
+        if len(costs) != len(self.goals):
+            result = None
+        else:
+            result = min_matching(costs)
+            if result >= UNREACHABLE:
+                result = None
+        self.cache[boxes] = result
+        return result
+
+    def moves(self, player: int, boxes: int):
+        """Gets the lower bound of the remaining moves, None if the boxes cannot be solved
+
+        Before its first push, the player walks next to some box, at least the distance to the nearest box less one.
+        These moves are no pushes, so they add to the lower bound of the pushes."""
+        pushes = self(boxes)
+        if not pushes:
+            return pushes
+        col, row = divmod(player, self.stride)
+        walk = min(abs(box_col - col) + abs(box_row - row)
+                   for box_col, box_row in (divmod(box, self.stride) for box in iter_cells(boxes)))
+        return pushes + walk - 1
@@ -0,0 +1,115 @@
+"""Hints of the optimal next move while playing, looked up in a table of the statuses along optimal solutions"""
+
+from action import Action
+from background_solve import BackgroundSolve
+from board import Board, MOVE_ACTIONS
+from game_status import GameStatus, PackedStatus
+from level import Level
+from replay import parse_moves
+
+ACTION_NAMES = {Action.MOVE_UP.value: "up", Action.MOVE_RIGHT.value: "right", Action.MOVE_DOWN.value: "down",
+                Action.MOVE_LEFT.value: "left"}
+
+
+class HintTable:
+    """Exact remaining counts of moves and the next move of the statuses along optimal solutions
+
+    The rest of an optimal solution solves each of its statuses optimally, so a hint is a single lookup."""
+
+    def __init__(self, board: Board):
+        self.board = board
+        self.remaining = {}
+        self.next_moves = {}
+
+    def add_solution(self, start: PackedStatus, directions: list):
+        """Adds the statuses of an optimal solution given as indices of the board offsets"""
+        status = start
+        for i, direction in enumerate(directions):
+            self.remaining[status] = len(directions) - i
+            self.next_moves[status] = direction
+            status = status.move(self.board.offsets[direction], self.board.walls)
+        self.remaining[status] = 0
+
+    def get(self, status: PackedStatus):
+        """Gets the remaining count of moves and the next move of a status, None if the status is not known"""
+        remaining = self.remaining.get(status)
+        if remaining is None:
+            return None
+        if remaining == 0:
+            return 0, Action.NOTHING
+        return remaining, MOVE_ACTIONS[self.next_moves[status]]
+
+
+class HintEngine:
+    """Gives hints while a level is played
+
+    Statuses along the known solutions are answered at once. When the player leaves them, the status is solved in
+    the background and the search stops as soon as it can continue along a known solution."""
+
+    def __init__(self, level: Level):
+        self.level = level
+        self.board = level.get_board()
+        self.table = HintTable(self.board)
+        # statuses from which the level cannot be solved
+        self.dead = set()
+        # errors of statuses whose solve failed
+        self.errors = {}
+        self.solving = None
+        self.solving_status = None
+
+    def add_solution(self, game_status: GameStatus, moves: str):
+        """Adds an optimal solution from a status, in the LURD notation"""
+        self.table.add_solution(self.board.pack(game_status), parse_moves(moves))
+
+    def get(self, game_status: GameStatus):
+        """Gets the remaining count of moves and the next move, None if the status is not known yet"""
+        return self.table.get(self.board.pack(game_status))
+
+    def request(self, game_status: GameStatus) -> str:
+        """Describes the hint for a status, starts solving the status in the background if it is not known"""
+        status = self.board.pack(game_status)
+        hint = self.table.get(status)
+        if hint is not None:
+            if hint[0] == 0:
+                return "Solved"
+            return "Hint: " + ACTION_NAMES[hint[1].value] + ", " + str(hint[0]) + " moves left"
+        if status in self.dead:
+            return "Not solvable from here, press R to restart"
+        if status in self.errors:
+            return "No hint: " + self.errors[status]
+        if self.solving_status != status:
+            self.cancel()
+            solved = Level(False, matrix=self.level.matrix, game_status=game_status, cache=self.level.cache)
+            self.solving = BackgroundSolve(solved, paths=True, known=(self.table.remaining, self.table.next_moves))
+            self.solving_status = status
+            self.poll()
+            if self.solving is None:
+                return self.request(game_status)
+        return "Computing hint..."
+
+    def poll(self) -> bool:
+        """Reads the result of the background solve, returns True once there is none running"""
+        if self.solving is None:
+            return True
+        if not self.solving.poll():
+            return False
+        if self.solving.path is not None:
+            self.table.add_solution(self.solving_status, parse_moves(self.solving.path))
+        elif self.solving.moves == -1:
+            self.dead.add(self.solving_status)
+        else:
+            self.errors[self.solving_status] = self.solving.error
+        self.solving = None
+        self.solving_status = None
+        return True
+
+    def is_busy(self) -> bool:
+        """Checks whether a status is being solved"""
+        return self.solving is not None
+
+    def cancel(self):
+        """Stops the background solve"""
+        if self.solving is not None:
+            self.solving.cancel()
+        self.solving = None
+        self.solving_status = None
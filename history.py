@@ -0,0 +1,185 @@
+"""Undo and redo of played moves and of edits, kept as logs of deltas instead of copies of the level"""
+
+import numpy as np
+
+import constants as const
+from game_status import GameStatus
+from replay import LURD, LURD_DIRECTIONS
+
+# moves between two statuses kept by the move history
+CHECKPOINT_INTERVAL = 64
+# column and row steps of the directions in the order of MOVE_ACTIONS
+STEPS = ((0, -1), (1, 0), (0, 1), (-1, 0))
+
+
+def step(game_status: GameStatus, direction: int, pushed: bool) -> GameStatus:
+    """Applies a move known to be possible, without checking the matrix"""
+    vector = np.array(STEPS[direction], const.POSITION)
+    player_pos = game_status.player_pos + vector
+    if not pushed:
+        return GameStatus(player_pos, game_status.box_pos)
+    box_pos = set(game_status.box_pos)
+    box_pos.remove(tuple(player_pos.tolist()))
+    box_pos.add(tuple((player_pos + vector).tolist()))
+    return GameStatus(player_pos, box_pos)
+
+
+def step_back(game_status: GameStatus, direction: int, pushed: bool) -> GameStatus:
+    """Takes back a move, a pushed box is pulled back to the cell of the player"""
+    vector = np.array(STEPS[direction], const.POSITION)
+    player_pos = game_status.player_pos - vector
+    if not pushed:
+        return GameStatus(player_pos, game_status.box_pos)
+    box_pos = set(game_status.box_pos)
+    box_pos.remove(tuple((game_status.player_pos + vector).tolist()))
+    box_pos.add(tuple(game_status.player_pos.tolist()))
+    return GameStatus(player_pos, box_pos)
+
+
+class MoveHistory:
+    """Moves played from a start status, one LURD letter per move, capital letters for pushes
+
+    Moves taken back stay in the log for redo until another move is played. The status after every
+    CHECKPOINT_INTERVAL moves is kept, so seeking to any move applies at most that many deltas. The log itself is the
+    LURD notation, so it is saved and loaded as a replay."""
+
+    def __init__(self, start: GameStatus):
+        self.log = bytearray()
+        self.position = 0
+        self.checkpoints = [start]
+
+    def __len__(self) -> int:
+        return len(self.log)
+
+    def get_moves(self, end: int = None) -> str:
+        """Gets the moves up to end, the current position by default, in the LURD notation"""
+        return self.log[:self.position if end is None else end].decode("ascii")
+
+    def record(self, game_status: GameStatus, direction: int, pushed: bool):
+        """Records a move that led to game_status, the moves taken back are dropped unless it is the next of them"""
+        letter = ord(LURD[direction].upper() if pushed else LURD[direction])
+        if self.position == len(self.log) or self.log[self.position] != letter:
+            del self.log[self.position:]
+            del self.checkpoints[self.position // CHECKPOINT_INTERVAL + 1:]
+            self.log.append(letter)
+        self.position += 1
+        self.add_checkpoint(game_status)
+
+    def extend(self, moves: str):
+        """Records moves in the LURD notation played from the current position, like record does for every move, their
+        checkpoints are kept once they are sought"""
+        letters = moves.encode("ascii")
+        if self.log[self.position:self.position + len(letters)] != letters:
+            del self.log[self.position:]
+            del self.checkpoints[self.position // CHECKPOINT_INTERVAL + 1:]
+            self.log += letters
+        self.position += len(letters)
+
+    def add_checkpoint(self, game_status: GameStatus):
+        """Keeps the status at the current position if it is the next checkpoint"""
+        if self.position % CHECKPOINT_INTERVAL == 0 and len(self.checkpoints) == self.position // CHECKPOINT_INTERVAL:
+            self.checkpoints.append(game_status)
+
+    def save(self, filepath: str):
+        """Saves the moves up to the current position as a replay in the LURD notation"""
+        with open(filepath, 'w', encoding="ascii") as file:
+            file.write(self.get_moves())
+            file.write("\n")
+
+    def get_move(self, index: int) -> (int, bool):
+        """Gets the direction of a move and whether it pushed a box"""
+        letter = chr(self.log[index])
+        return LURD_DIRECTIONS[letter], letter.isupper()
+
+    def undo(self, game_status: GameStatus):
+        """Takes back the last move, returns the previous status or None if there is no move to take back"""
+        if self.position == 0:
+            return None
+        self.position -= 1
+        return step_back(game_status, *self.get_move(self.position))
+
+    def redo(self, game_status: GameStatus):
+        """Plays the last move taken back again, returns the next status or None if there is no such move"""
+        if self.position == len(self.log):
+            return None
+        self.position += 1
+        new_status = step(game_status, *self.get_move(self.position - 1))
+        self.add_checkpoint(new_status)
+        return new_status
+
+    def seek(self, position: int) -> GameStatus:
+        """Goes to the status after a count of moves, from the closest checkpoint before it"""
+        position = max(0, min(position, len(self.log)))
+        index = min(position // CHECKPOINT_INTERVAL, len(self.checkpoints) - 1)
+        game_status = self.checkpoints[index]
+        self.position = index * CHECKPOINT_INTERVAL
+        while self.position < position:
+            self.position += 1
+            game_status = step(game_status, *self.get_move(self.position - 1))
+            self.add_checkpoint(game_status)
+        return game_status
+
+
+class EditHistory:
+    """Edits of a level, each kept as the part of the level it changed with its old and new value
+
+    Kinds of edits are "cell" of the matrix at a position, "boxes", "player" and "matrix" for resizing. The values
+    are shared with the level instead of copied, only cells are changed in place, which is consistent as edits are
+    taken back in the reverse order."""
+
+    def __init__(self):
+        self.edits = []
+        self.position = 0
+
+    @staticmethod
+    def get_value(level, kind: str, pos: tuple = None):
+        """Gets the current value of the part of the level"""
+        if kind == "cell":
+            return int(level.matrix[pos])
+        if kind == "boxes":
+            return level.game_status.box_pos
+        if kind == "player":
+            return level.game_status.player_pos
+        if kind == "matrix":
+            return level.matrix
+        raise ValueError("Unknown kind of edit")
+
+    @staticmethod
+    def set_value(level, kind: str, pos: tuple, value):
+        """Sets the part of the level"""
+        if kind == "cell":
+            level.matrix[pos] = value
+        elif kind == "boxes":
+            level.game_status.box_pos = value
+        elif kind == "player":
+            level.game_status.player_pos = value
+        elif kind == "matrix":
+            level.matrix = value
+        else:
+            raise ValueError("Unknown kind of edit")
+
+    def edit(self, level, kind: str, value, pos: tuple = None):
+        """Changes a part of the level and records the change, the edits taken back are dropped"""
+        old = self.get_value(level, kind, pos)
+        self.set_value(level, kind, pos, value)
+        del self.edits[self.position:]
+        self.edits.append((kind, pos, old, value))
+        self.position += 1
+
+    def undo(self, level) -> bool:
+        """Takes back the last edit, returns False if there is none"""
+        if self.position == 0:
+            return False
+        self.position -= 1
+        kind, pos, old, _ = self.edits[self.position]
+        self.set_value(level, kind, pos, old)
+        return True
+
+    def redo(self, level) -> bool:
+        """Makes the last edit taken back again, returns False if there is none"""
+        if self.position == len(self.edits):
+            return False
+        kind, pos, _, new = self.edits[self.position]
+        self.set_value(level, kind, pos, new)
+        self.position += 1
+        return True
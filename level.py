@@ -1,23 +1,49 @@
 """Class that represents an opened level the user is currently playing"""
 
+import hashlib
+
 import numpy as np
 
 import constants as const
+import solver
+from solver_cache import SolverCache, DEFAULT_CACHE
+from board import Board, MOVE_ACTIONS
 from game_status import GameStatus
+from history import MoveHistory
+from pack import open_pack
+from replay import verify, verify_batch
 from action import Action
 
+INVALID = 255
+HAS_PLAYER = 1
+HAS_BOX = 2
+
+
+def get_char_table(chars: str, value, default) -> np.ndarray:
+    """Creates a lookup table from character codes to values"""
+    table = np.full(256, default, np.uint8)
+    table[np.frombuffer(chars.encode("ascii"), np.uint8)] = value
+    return table
+
+
+# lookup tables from the characters of .lvl files and XSB packs to the matrix and the objects
+CHAR_CELLS = get_char_table(" -_@$", const.NOTHING, INVALID)
+CHAR_CELLS[ord("#")] = const.WALL
+CHAR_CELLS[np.frombuffer(b".PB+*", np.uint8)] = const.DESTINATION
+CHAR_PLAYER = get_char_table("@P+", True, False).astype(bool)
+CHAR_BOX = get_char_table("$B*", True, False).astype(bool)
+# lookup table from the matrix value * 4 + the objects in a cell to the saved character
+SAVE_CHARS = np.frombuffer(b" @$?#???.PB?", np.uint8)
+# characters of a saved replay read at once
+REPLAY_CHUNK = 65536
+
 
 class Level:
     """Class that represents an opened level the user is currently playing"""
 
     def get_dests(self):
         """Gets the positions of destinations"""
-        dests = set()
-        for row in range(self.matrix.shape[1]):
-            for col in range(self.matrix.shape[0]):
-                if self.matrix[col][row] == const.DESTINATION:
-                    dests.add((col, row))
-        return frozenset(dests)
+        return frozenset(map(tuple, np.argwhere(self.matrix == const.DESTINATION).tolist()))
 
     def is_win(self, game_status: GameStatus = None):
         """Check that game_status is winning"""
@@ -25,140 +51,244 @@ class Level:
             game_status = self.game_status
         return game_status.box_pos == self.get_dests()
 
+    def get_board(self) -> Board:
+        """Gets the flat cell layout of the current matrix"""
+        return Board(self.matrix)
+
     def bfs(self):
-        """Breadth first search that finds the optimal count of moves to solve level"""
-        if len(self.game_status.box_pos) != len(self.get_dests()):
-            return -1
-        visited = {self.game_status: 0}
-        queue = [self.game_status]
-        while queue:
-            visiting = queue.pop(0)
-            if self.is_win(visiting):
-                return visited[visiting]
-            for action in [Action.MOVE_UP, Action.MOVE_RIGHT, Action.MOVE_DOWN, Action.MOVE_LEFT]:
-                to_visit = visiting.handle_action(action, self.matrix)
-                if to_visit not in visited:
-                    queue.append(to_visit)
-                    visited[to_visit] = visited[visiting] + 1
-        return -1
+        """Breadth first search that finds the optimal count of moves to solve level, a layer at once"""
+        return self.solve("batch")
+
+    def solve(self, engine: str = "push", corrals: bool = False, stats: solver.SolverStats = None,
+              budget: solver.SolverBudget = None) -> int:
+        """Finds the optimal count of moves to solve level with the chosen solver engine, -1 if not solvable"""
+        board = self.get_board()
+        return solver.solve(board, board.pack(self.game_status), engine, corrals, stats, budget)
+
+    def solve_anytime(self, time_limit: float = 0, node_limit: int = 0, corrals: bool = False,
+                      stats: solver.SolverStats = None, budget: solver.SolverBudget = None) -> dict:
+        """Finds a solution quickly and improves it until it is proven optimal or the time or node limit is reached,
+        the report tells the count of moves, the moves and whether they are proven optimal"""
+        board = self.get_board()
+        return solver.solve_anytime(board, board.pack(self.game_status), time_limit, node_limit, corrals, stats,
+                                    budget)
+
+    def replay(self, moves, first_move: int = 0) -> dict:
+        """Replays moves in the LURD notation or move actions from the current status, without changing it, moves in
+        the error are numbered from first_move + 1"""
+        board = self.get_board()
+        return verify(board, board.pack(self.game_status), moves, self.optimal_moves, first_move)
+
+    def apply_moves(self, moves, first_move: int = 0) -> dict:
+        """Plays moves in the LURD notation or move actions, stops at the first move that is not possible"""
+        report = self.replay(moves, first_move)
+        self.game_status = report["status"]
+        self.history.extend(report["lurd"])
+        self.moves = self.history.position
+        return report
+
+    def save_moves(self, filepath: str):
+        """Saves the moves played from the start as a replay in the LURD notation"""
+        self.history.save(filepath)
+
+    def load_moves(self, filepath: str) -> dict:
+        """Plays a saved replay from the start of the level, the file is read a chunk at a time"""
+        self.restart()
+        pushes = 0
+        error = None
+        with open(filepath, 'r', encoding="ascii") as file:
+            for chunk in iter(lambda: file.read(REPLAY_CHUNK), ""):
+                # the moves in the error are numbered from the start of the level
+                report = self.apply_moves(chunk, self.moves)
+                pushes += report["pushes"]
+                if not report["valid"]:
+                    error = report["error"]
+                    break
+        report = self.replay("")
+        report.update(moves=self.moves, pushes=pushes, lurd=self.history.get_moves(), valid=error is None,
+                      error=error)
+        report["solved"] = error is None and report["solved"]
+        report["optimal"] = None if self.optimal_moves < 0 else report["solved"] and self.moves == self.optimal_moves
+        return report
+
+    def verify_solutions(self, solutions: list, jobs: int = 1) -> list:
+        """Verifies recorded solutions from the current status, in a pool of jobs processes if jobs is more than 1"""
+        board = self.get_board()
+        return verify_batch(board, board.pack(self.game_status), solutions, self.optimal_moves, jobs)
 
     def load(self):
-        """Loads a level from filepath"""
+        """Loads a level from filepath, or the level with pack_index from the pack at filepath"""
         if not isinstance(self.filepath, str) or len(self.filepath) == 0:
             raise ValueError("Cannot load level with given filepath")
-        preload = []
-        cols = -1
-        with open(self.filepath, 'r', encoding="utf-8") as file:
-            for row in file.read().splitlines():
-                preload.append(row)
-                cols = cols if cols >= len(row) else len(row)
+        if self.pack_index is None:
+            with open(self.filepath, 'r', encoding="utf-8") as file:
+                self.parse(file.read().splitlines())
+        else:
+            self.parse(open_pack(self.filepath).get_lines(self.pack_index))
+
+    def parse(self, preload: list):
+        """Parses the rows of a level, both the characters of .lvl files and of XSB packs are accepted"""
         rows = len(preload)
-        self.matrix = np.zeros((cols, rows), dtype=np.uint8)
-
-        player_pos = np.array([-1, -1], np.int8)
-        box_pos = set()
-
-        for row in range(rows):
-            for col in range(cols):
-                curr_pos = ' ' if len(preload[row]) <= col else preload[row][col]
-                # nothing
-                if curr_pos == ' ':
-                    self.matrix[col][row] = const.NOTHING
-                    continue
-                # wall
-                if curr_pos == '#':
-                    self.matrix[col][row] = const.WALL
-                    continue
-                load_valid = False
-                # Player
-                if curr_pos in "@P":
-                    load_valid = True
-                    player_pos = np.array([col, row], np.int8)
-                # Box
-                if curr_pos in "$B":
-                    load_valid = True
-                    box_pos.add((col, row))
-                # Dest
-                if curr_pos in ".PB":
-                    load_valid = True
-                    self.matrix[col][row] = const.DESTINATION
-                if not load_valid:
-                    raise ValueError("Invalid character loaded from file")
+        cols = max((len(row) for row in preload), default=0)
+        # every character is one byte, characters outside ASCII become "?" and are rejected below
+        data = "".join(row.ljust(cols) for row in preload).encode("ascii", "replace")
+        chars = np.frombuffer(data, np.uint8).reshape(rows, cols).T
+        cells = CHAR_CELLS[chars]
+        if np.any(cells == INVALID):
+            raise ValueError("Invalid character loaded from file")
+        self.matrix = np.ascontiguousarray(cells)
+
+        player_pos = np.array([-1, -1], const.POSITION)
+        # the last player in reading order is kept
+        players = np.argwhere(CHAR_PLAYER[chars].T)
+        if len(players) > 0:
+            player_pos = np.array([players[-1][1], players[-1][0]], const.POSITION)
+        box_pos = set(map(tuple, np.argwhere(CHAR_BOX[chars]).tolist()))
         self.game_status = GameStatus(player_pos, box_pos)
+        self.history = MoveHistory(self.game_status)
+        self.loaded_hash = self.get_hash()
 
-    def get_char(self, col: int, row: int) -> str:
-        """Converts a position to a character to save"""
-        has_player = np.array_equal(self.game_status.player_pos, np.array([col, row], np.int8))
-        has_box = (col, row) in self.game_status.box_pos
-        if self.matrix[col][row] == const.WALL:
-            if has_box or has_player:
-                raise ValueError("Player nor box cannot be inside wall")
-            return "#"
-        if has_player and has_box:
+    def serialize(self) -> str:
+        """Converts the level to the text of a .lvl file"""
+        if self.matrix.size > 0 and self.matrix.max() > const.DESTINATION:
+            raise ValueError("Unknown value in level matrix")
+        cols, rows = self.matrix.shape
+        objects = np.zeros((cols, rows), np.uint8)
+        # objects outside the matrix, e.g. after resizing, are not saved
+        boxes = [box for box in self.game_status.box_pos if 0 <= box[0] < cols and 0 <= box[1] < rows]
+        if boxes:
+            objects[tuple(np.array(boxes).T)] = HAS_BOX
+        player_col, player_row = int(self.game_status.player_pos[0]), int(self.game_status.player_pos[1])
+        if 0 <= player_col < cols and 0 <= player_row < rows:
+            objects[player_col, player_row] |= HAS_PLAYER
+        codes = self.matrix.astype(np.uint8) * 4 + objects
+        if np.any((self.matrix == const.WALL) & (objects != 0)):
+            raise ValueError("Player nor box cannot be inside wall")
+        if np.any(objects == HAS_PLAYER | HAS_BOX):
             raise ValueError("Player cannot be inside box")
-        if self.matrix[col][row] == const.NOTHING:
-            if has_player:
-                return "@"
-            if has_box:
-                return "$"
-            return " "
-        if self.matrix[col][row] == const.DESTINATION:
-            if has_player:
-                return "P"
-            if has_box:
-                return "B"
-            return "."
-        raise ValueError("Unknown value in level matrix")
+        chars = np.full((rows, cols + 1), ord("\n"), np.uint8)
+        chars[:, :cols] = SAVE_CHARS[codes].T
+        return chars.tobytes().decode("ascii")
 
     def save(self):
         """Saves a level to a file"""
+        if self.pack_index is not None:
+            raise ValueError("Cannot save a level of a pack")
+        text = self.serialize()
         with open(self.filepath, 'w', encoding="utf-8") as file:
-            for row in range(self.matrix.shape[1]):
-                str_to_write = ""
-                for col in range(self.matrix.shape[0]):
-                    str_to_write += self.get_char(col, row)
-                file.write(str_to_write + "\n")
-
-    def check_level(self):
-        """Checks whether the level is playable"""
+            file.write(text)
+        new_hash = self.get_hash()
+        if self.cache is not None and self.loaded_hash is not None and self.loaded_hash != new_hash:
+            self.cache.invalidate(self.loaded_hash)
+        self.loaded_hash = new_hash
+
+    def get_hash(self) -> str:
+        """Hashes the matrix and the game status, used as the key of cached solver results"""
+        digest = hashlib.sha256()
+        digest.update(np.array(self.matrix.shape, np.int64).tobytes())
+        digest.update(np.ascontiguousarray(self.matrix, np.uint8).tobytes())
+        digest.update(np.array(self.game_status.player_pos, np.int64).tobytes())
+        digest.update(np.array(sorted(self.game_status.box_pos), np.int64).tobytes())
+        return digest.hexdigest()
+
+    def check_objects(self):
+        """Checks whether the level has a player and as many boxes as destinations, without solving it"""
         if self.game_status.player_pos[0] < 0 or self.game_status.player_pos[1] < 0:
             raise ValueError("No player was loaded")
         if len(self.game_status.box_pos) != len(self.get_dests()):
             raise ValueError("Level has incorrect count of objects")
-        self.optimal_moves = self.bfs()
+
+    def check_level(self, engine: str = "push", stats: solver.SolverStats = None,
+                    budget: solver.SolverBudget = None, time_limit: float = 0, node_limit: int = 0):
+        """Checks whether the level is playable, the optimal count of moves is found with the chosen solver engine
+
+        With a time or node limit the anytime solver is used instead, if it is reached the best count of moves found
+        is kept and proven is False."""
+        self.check_objects()
+        key = self.get_hash()
+        cached = None if self.cache is None else self.cache.get(key)
+        if cached is not None:
+            self.optimal_moves = cached["moves"]
+            self.proven = True
+        elif time_limit or node_limit:
+            report = self.solve_anytime(time_limit, node_limit, stats=stats, budget=budget)
+            self.optimal_moves = report["moves"]
+            self.proven = report["proven"]
+        else:
+            self.optimal_moves = self.solve(engine, stats=stats, budget=budget)
+            self.proven = True
+        if cached is None and self.proven and self.cache is not None:
+            self.cache.put(key, self.optimal_moves)
         if self.optimal_moves == -1:
-            raise ValueError("Level is not solvable")
+            raise ValueError("Level is not solvable" if self.proven else "No solution found within the limits")
 
     def reload(self):
         """Reloads a level to play"""
         self.load()
         self.check_level()
 
+    def restart(self):
+        """Goes back to the start of the level to play again, the moves played stay in the history for redo"""
+        self.game_status = self.history.seek(0)
+        self.moves = 0
+
+    def undo(self) -> bool:
+        """Takes back the last move, returns False if there is none"""
+        game_status = self.history.undo(self.game_status)
+        if game_status is None:
+            return False
+        self.game_status = game_status
+        self.moves = self.history.position
+        return True
+
+    def redo(self) -> bool:
+        """Plays the last move taken back again, returns False if there is none"""
+        game_status = self.history.redo(self.game_status)
+        if game_status is None:
+            return False
+        self.game_status = game_status
+        self.moves = self.history.position
+        return True
+
     def handle_action(self, action: Action):
         """Handles an action from the user"""
         if action == Action.RESET:
-            self.moves = 0
-            self.reload()
+            self.restart()
             return
-        if action in [Action.MOVE_UP, Action.MOVE_RIGHT, Action.MOVE_DOWN, Action.MOVE_LEFT]:
+        if action in MOVE_ACTIONS:
             new_game_status = self.game_status.handle_action(action, self.matrix)
             if new_game_status != self.game_status:
-                self.moves += 1
+                self.history.record(new_game_status, action.value - Action.MOVE_UP.value,
+                                    new_game_status.box_pos != self.game_status.box_pos)
+                self.moves = self.history.position
                 self.game_status = new_game_status
             return
+        if action == Action.UNDO:
+            self.undo()
+            return
+        if action == Action.REDO:
+            self.redo()
+            return
         if action == Action.NOTHING:
             return
         raise ValueError("Invalid action passed to level")
 
     def __init__(self, play: bool, filepath: str = "", matrix=np.zeros((10, 10), dtype=np.uint8),
-                 game_status=GameStatus(np.zeros(2, np.int8), set())):
+                 game_status=GameStatus(np.zeros(2, const.POSITION), set()), cache: SolverCache = DEFAULT_CACHE,
+                 pack_index: int = None):
         self.filepath = filepath
+        self.pack_index = pack_index
+        self.cache = cache
+        self.loaded_hash = None
         if self.filepath == "":
             self.matrix = matrix
             self.game_status = game_status.copy()
+            self.history = MoveHistory(self.game_status)
         else:
             self.load()
         self.moves = 0
         self.optimal_moves = -1
+        # False while optimal_moves is only the best count of moves found, not proven optimal
+        self.proven = True
         if play:
             self.check_level()
@@ -0,0 +1,148 @@
+"""Index of levels with their metadata, so that the menus do not have to load and solve every level"""
+
+import json
+import os
+from pathlib import Path
+
+from level import Level
+from solver_cache import SolverCache, DEFAULT_CACHE
+
+NOT_SOLVABLE = "Level is not solvable"
+
+
+def get_key(filepath: str) -> str:
+    """Normalises a path, so that "./levels/a.lvl" and "levels/a.lvl" share an entry"""
+    return os.path.normpath(filepath)
+
+
+class LevelIndex:
+    """Metadata of levels keyed by their path, stored in one JSON file
+
+    An entry is reused while the size and the modification time of its file stay the same. Otherwise the level is
+    parsed again and its optimal count of moves is kept only if the hash of its content did not change. Levels that
+    were not solved yet are looked up in the solver cache."""
+
+    def __init__(self, filepath: str = "./.level_index.json", cache: SolverCache = DEFAULT_CACHE):
+        self.filepath = None if filepath is None else Path(filepath)
+        self.cache = cache
+        self.entries = self.load()
+        self.changed = False
+
+    def load(self) -> dict:
+        """Loads the stored entries"""
+        if self.filepath is None:
+            return {}
+        try:
+            with open(self.filepath, 'r', encoding="utf-8") as file:
+                entries = json.load(file)
+        except (OSError, ValueError):
+            return {}
+        return entries if isinstance(entries, dict) else {}
+
+    def store(self):
+        """Stores the entries if any of them changed"""
+        if self.filepath is None or not self.changed:
+            return
+        try:
+            with open(self.filepath, 'w', encoding="utf-8") as file:
+                json.dump(self.entries, file)
+            self.changed = False
+        except OSError:
+            # the index is only an optimisation, it is rebuilt next time
+            pass
+
+    def describe(self, filepath: str, stat: os.stat_result) -> dict:
+        """Loads a level and creates its entry"""
+        entry = {"path": get_key(filepath), "mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "hash": None,
+                 "cols": 0, "rows": 0, "boxes": 0, "destinations": 0, "moves": None, "error": None}
+        try:
+            level = Level(False, filepath, cache=None)
+        except ValueError as e:
+            entry["error"] = str(e)
+            return entry
+        entry["hash"] = level.get_hash()
+        entry["cols"], entry["rows"] = (int(x) for x in level.matrix.shape)
+        entry["boxes"] = len(level.game_status.box_pos)
+        entry["destinations"] = len(level.get_dests())
+        try:
+            level.check_objects()
+        except ValueError as e:
+            entry["error"] = str(e)
+        return entry
+
+    def get(self, filepath: str) -> dict:
+        """Gets the entry of a level, updating it if the file changed"""
+        key = get_key(filepath)
+        stat = os.stat(filepath)
+        entry = self.entries.get(key)
+        if entry is None or entry["mtime_ns"] != stat.st_mtime_ns or entry["size"] != stat.st_size:
+            new_entry = self.describe(filepath, stat)
+            if entry is not None and entry["hash"] is not None and entry["hash"] == new_entry["hash"]:
+                new_entry["moves"] = entry["moves"]
+                new_entry["error"] = entry["error"]
+            entry = new_entry
+            self.entries[key] = entry
+            self.changed = True
+        if entry["moves"] is None and entry["error"] is None and entry["hash"] is not None and self.cache is not None:
+            cached = self.cache.get(entry["hash"])
+            if cached is not None:
+                self.set_moves(entry, cached["moves"])
+        return entry
+
+    def scan(self, directory: str = "./levels", suffix: str = ".lvl") -> list:
+        """Gets the entries of all levels in a directory sorted by path, entries of removed files are dropped"""
+        filepaths = sorted(str(f) for f in Path(directory).iterdir() if f.is_file() and f.suffix == suffix)
+        entries = [self.get(filepath) for filepath in filepaths]
+        directory_key = get_key(directory)
+        present = {entry["path"] for entry in entries}
+        for key in list(self.entries):
+            if os.path.dirname(key) == directory_key and key.endswith(suffix) and key not in present:
+                del self.entries[key]
+                self.changed = True
+        self.store()
+        return entries
+
+    def update(self, level: Level):
+        """Updates the entry of a level that was just saved"""
+        self.get(level.filepath)
+        self.store()
+
+    def set_moves(self, entry: dict, moves: int):
+        """Stores the optimal count of moves into an entry, -1 if the level is not solvable"""
+        entry["moves"] = moves
+        entry["error"] = NOT_SOLVABLE if moves == -1 else None
+        self.changed = True
+
+    def set_result(self, filepath: str, moves: int, key: str = None):
+        """Sets the optimal count of moves of a level, unless the level changed since it was solved, call store after
+
+        key is the hash of the solved level content, if known"""
+        try:
+            entry = self.get(filepath)
+        except OSError:
+            return
+        if entry["hash"] is None or (key is not None and entry["hash"] != key):
+            return
+        self.set_moves(entry, moves)
+
+
+def get_label(entry: dict) -> str:
+    """Describes a level in a menu by its name and its difficulty"""
+    name = Path(entry["path"]).stem
+    if entry["error"] is not None:
+        return name + " (" + entry["error"] + ")"
+    if entry["moves"] is not None:
+        return name + " (" + str(entry["moves"]) + " moves)"
+    return name + " (" + str(entry["cols"]) + "x" + str(entry["rows"]) + ", " + str(entry["boxes"]) + " boxes)"
+
+
+def get_difficulty(entry: dict) -> tuple:
+    """Sort key of levels from the easiest, levels not solved yet follow by size and broken levels are last"""
+    if entry["error"] is not None:
+        return 2, 0, entry["path"]
+    if entry["moves"] is None:
+        return 1, entry["boxes"] * entry["cols"] * entry["rows"], entry["path"]
+    return 0, entry["moves"], entry["path"]
+
+
+LEVEL_INDEX = LevelIndex()
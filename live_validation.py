@@ -0,0 +1,172 @@
+"""Validation of a level while it is edited, in a worker process kept for the whole editing session"""
+
+import multiprocessing
+import time
+
+import solver
+from board import Board
+from level import Level
+
+# seconds without an edit before the level is validated
+DEBOUNCE = 0.5
+# expanded states between checks whether the solve became stale
+CANCEL_INTERVAL = 500
+# message that stops the current solve of the worker
+CANCEL = "cancel"
+
+
+class SolveCancelled(Exception):
+    """Raised in the worker when a newer edit arrives during a solve"""
+
+
+def _worker(connection, engine: str):
+    """Solves the levels sent through the connection until None is sent, any message cancels the current solve
+
+    The worker lives for the whole editing session, so the tables the solver computes for a board are reused while
+    only the boxes and the player are moved."""
+    job = None
+    while True:
+        try:
+            job = connection.recv() if job is None else job
+        except EOFError:
+            return
+        if job is None:
+            return
+        if job == CANCEL:
+            job = None
+            continue
+        job_id, matrix, game_status = job
+        job = None
+
+        def check_cancel(stats: solver.SolverStats):
+            if stats.result is None and connection.poll():
+                raise SolveCancelled()
+            connection.send(("progress", job_id, stats.expanded))
+
+        stats = solver.SolverStats(check_cancel, CANCEL_INTERVAL)
+        try:
+            board = Board(matrix)
+            message = ("result", job_id, solver.solve(board, board.pack(game_status), engine, stats=stats))
+        except SolveCancelled:
+            # the message that cancelled the solve is handled next
+            try:
+                job = connection.recv()
+            except EOFError:
+                return
+            if job is None:
+                return
+            continue
+        except ValueError as e:
+            message = ("error", job_id, str(e))
+        except Exception as e:
+            message = ("error", job_id, "An unexpected error occurred: " + str(e))
+        try:
+            connection.send(message)
+        except OSError:
+            return
+
+
+class LiveValidator:
+    """Validates the edited level in the background, once no edit came for the debounce time
+
+    Boxes not matching destinations are reported right away. Levels solved before are taken from the solver cache
+    of the level, otherwise they are solved in the worker, which drops the solve of a previous edit."""
+
+    def __init__(self, engine: str = "push", debounce: float = DEBOUNCE):
+        self.engine = engine
+        self.debounce = debounce
+        self.process = None
+        self.connection = None
+        self.job_id = 0
+        self.level = None
+        self.key = None
+        self.due = None
+        self.solving = False
+        self.expanded = 0
+        self.status = "Not checked yet"
+
+    def edited(self, level: Level):
+        """Notes an edit of the level, the level is validated once the debounce time passes without another edit"""
+        self.level = level
+        self.job_id += 1
+        self.due = time.perf_counter() + self.debounce
+        if self.solving:
+            self.connection.send(CANCEL)
+        self.solving = False
+        self.status = "Editing..."
+
+    def is_busy(self) -> bool:
+        """Checks whether a validation is still waiting for the debounce or for the solver"""
+        return self.due is not None or self.solving
+
+    def start(self):
+        """Checks the objects of the level and starts solving it, unless the result is known"""
+        self.due = None
+        level = self.level
+        try:
+            level.check_objects()
+        except ValueError as e:
+            self.status = str(e) + " (" + str(len(level.game_status.box_pos)) + " boxes, " + \
+                str(len(level.get_dests())) + " destinations)"
+            return
+        self.key = level.get_hash()
+        cached = None if level.cache is None else level.cache.get(self.key)
+        if cached is not None:
+            self.set_result(cached["moves"])
+            return
+        if self.process is None or not self.process.is_alive():
+            self.connection, child_connection = multiprocessing.Pipe()
+            self.process = multiprocessing.Process(target=_worker, args=(child_connection, self.engine), daemon=True)
+            self.process.start()
+            child_connection.close()
+        self.connection.send((self.job_id, level.matrix.copy(), level.game_status.copy()))
+        self.solving = True
+        self.expanded = 0
+        self.status = "Solving..."
+
+    def set_result(self, moves: int):
+        """Shows the optimal count of moves"""
+        self.solving = False
+        self.status = "Not solvable" if moves == -1 else "Optimal moves: " + str(moves)
+
+    def poll(self) -> bool:
+        """Starts the validation once it is due and reads the messages of the worker, returns True if the status
+        changed"""
+        status = self.status
+        if self.due is not None and time.perf_counter() >= self.due:
+            self.start()
+        try:
+            while self.solving and self.connection.poll():
+                kind, job_id, value = self.connection.recv()
+                if job_id != self.job_id:
+                    continue
+                if kind == "progress":
+                    self.expanded = value
+                    self.status = "Solving... (" + str(value) + " states)"
+                elif kind == "result":
+                    if self.level.cache is not None:
+                        self.level.cache.put(self.key, value)
+                    self.set_result(value)
+                else:
+                    self.solving = False
+                    self.status = value
+        except (EOFError, OSError):
+            self.solving = False
+            self.status = "Solver exited with code " + str(self.process.exitcode)
+            self.process = None
+        return self.status != status
+
+    def close(self):
+        """Stops the worker"""
+        if self.process is None:
+            return
+        try:
+            self.connection.send(None)
+        except OSError:
+            pass
+        self.process.join(0.5)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.connection.close()
+        self.process = None
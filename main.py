@@ -7,39 +7,28 @@ from pathlib import Path
 import numpy as np
 import pygame
 from pygame.surface import Surface
-from pygame.locals import *
 
 import constants
 from level import Level
+from level_index import LEVEL_INDEX, get_difficulty, get_label
+from live_validation import LiveValidator
 from action import Action
+from background_solve import BackgroundSolve
+from events import EventLoop
+from fonts import FONTS
+from hint import HintEngine
+from history import EditHistory
+from pack import PACK_SUFFIXES, open_pack
+from renderer import LevelRenderer, get_img_size, get_view_shape
 
-
-def get_action() -> Action:
-    """Gets the action from pygame events"""
-    for event in pygame.event.get():
-        if event.type == QUIT:
-            return Action.EXIT
-        if event.type == KEYDOWN:
-            if event.key == K_ESCAPE:
-                return Action.EXIT
-            if event.key in [K_RETURN, K_KP_ENTER]:
-                return Action.ENTER
-            if event.key == K_r:
-                return Action.RESET
-            if event.key == K_UP:
-                return Action.MOVE_UP
-            if event.key == K_RIGHT:
-                return Action.MOVE_RIGHT
-            if event.key == K_DOWN:
-                return Action.MOVE_DOWN
-            if event.key == K_LEFT:
-                return Action.MOVE_LEFT
-    return Action.NOTHING
+EVENT_LOOP = EventLoop()
+# seconds the score dialog waits for the optimal count of moves
+SCORE_WAIT = 3
 
 
 def get_text_surface(string: str, size: int):
-    """Sort of a macro to render a text to surface"""
-    return pygame.font.SysFont(pygame.font.get_default_font(), size).render(string, True, (255, 255, 255))
+    """Sort of a macro to render a text to surface, recently rendered texts are cached"""
+    return FONTS.render(string, size)
 
 
 def render_choice_menu(menu_name: str, choices: list, current_choice: int, display_surf: Surface):
@@ -60,108 +49,140 @@ def render_choice_menu(menu_name: str, choices: list, current_choice: int, displ
     pygame.display.update()
 
 
-def render_level(to_render: Level, display_surf: Surface, selection_pos: np.array = np.array([-1])):
-    """Renders a level"""
-    display_surf.fill((0, 0, 0))
-
-    wall = pygame.image.load("assets/wall.png").convert()
-    dest = pygame.image.load("assets/dest.png").convert()
-    nothing = pygame.image.load("assets/nothing.png").convert()
-
-    box = pygame.image.load("assets/box.png").convert_alpha()
-    box_on_dest = pygame.image.load("assets/box_on_dest.png").convert_alpha()
-    player = pygame.image.load("assets/player.png").convert_alpha()
-    selection = pygame.image.load("assets/selection.png").convert_alpha()
-
-    img_size = wall.get_width()  # images should be square
-
-    # draw environment
-    for i in range(0, to_render.matrix.shape[0]):
-        for j in range(0, to_render.matrix.shape[1]):
-            if to_render.matrix[i][j] == constants.WALL:
-                display_surf.blit(wall, (i * img_size, j * img_size))
-            elif to_render.matrix[i][j] == constants.DESTINATION:
-                display_surf.blit(dest, (i * img_size, j * img_size))
-            elif to_render.matrix[i][j] == constants.NOTHING:
-                display_surf.blit(nothing, (i * img_size, j * img_size))
-            else:
-                raise ValueError("Unknown value read from level matrix")
-    # draw boxes
-    for boxPos in to_render.game_status.box_pos:
-        if to_render.matrix[boxPos] == constants.DESTINATION:
-            display_surf.blit(box_on_dest, (boxPos[0] * img_size, boxPos[1] * img_size))
-        else:
-            display_surf.blit(box, (boxPos[0] * img_size, boxPos[1] * img_size))
-    # draw player
-    display_surf.blit(player,
-                      (to_render.game_status.player_pos[0] * img_size, to_render.game_status.player_pos[1] * img_size))
-    if selection_pos[0] != -1:
-        display_surf.blit(selection, (selection_pos[0] * img_size, selection_pos[1] * img_size))
-    pygame.display.update()
-
-
 def get_new_display_surf(shape: (int, int)):
-    """Returns a new surface large enough to render level"""
-    img_size = pygame.image.load("assets/nothing.png").get_width()
-    return pygame.display.set_mode((img_size * shape[0], img_size * shape[1]))
-
-
-def play_level(filepath: str):
-    """Lets player play a level"""
+    """Returns a new surface large enough to render level, or the view of a level larger than the screen"""
+    img_size = get_img_size()
+    cols, rows = get_view_shape(shape)
+    return pygame.display.set_mode((img_size * cols, img_size * rows))
+
+
+def get_solving_caption(name: str, solving: BackgroundSolve) -> str:
+    """Gets the window caption with the state of solving the level"""
+    if not solving.done:
+        best = "" if solving.best is None else "best found: " + str(solving.best) + " moves, "
+        return "Sokoban - " + name + " (solving, " + best + str(solving.expanded) + " states expanded)"
+    if solving.error is None:
+        return "Sokoban - " + name + " (optimal moves: " + str(solving.level.optimal_moves) + ")"
+    return "Sokoban - " + name
+
+
+def play_level(filepath: str, pack_index: int = None):
+    """Lets player play a level, or a level of a pack, the optimal count of moves and a solution for hints are found
+    in the background"""
+    name = filepath if pack_index is None else filepath + " #" + str(pack_index + 1)
     level = None
     try:
-        level = Level(True, filepath)
+        level = Level(False, filepath, pack_index=pack_index)
+        level.check_objects()
     except ValueError as e:
         tkinter.messagebox.showerror("Error", "Failed to load level: " + str(e))
         return
     except Exception as e:
         tkinter.messagebox.showerror("Error", "An unexpected error occurred: " + str(e))
         return
+    solving = BackgroundSolve(level, paths=True, anytime=True)
+    hints = HintEngine(level)
+    start_status = level.game_status.copy()
     display_surf = get_new_display_surf(level.matrix.shape)
-    pygame.display.set_caption("Sokoban - " + filepath)
+    renderer = LevelRenderer(display_surf)
+    overlay = None
+    hint_text = None
+    shown_progress = None
+    renderer.render(level)
+
+    def update_solving() -> bool:
+        nonlocal shown_progress
+        done = solving.poll()
+        # the caption is set only when it changes
+        progress = (solving.expanded, solving.best, done)
+        if progress != shown_progress:
+            shown_progress = progress
+            pygame.display.set_caption(get_solving_caption(name, solving))
+        if done and solving.moves is not None and pack_index is None:
+            LEVEL_INDEX.set_result(filepath, solving.moves, solving.key)
+            LEVEL_INDEX.store()
+        if done and solving.path is not None:
+            hints.add_solution(start_status, solving.path)
+        return done
+
+    def update_hint() -> bool:
+        nonlocal overlay, hint_text
+        # the hint waits for the solution from the start
+        text = "Computing hint..."
+        if solving.done:
+            hints.poll()
+            text = hints.request(level.game_status)
+        if text != hint_text:
+            hint_text = text
+            overlay = get_status_overlay(text)
+            renderer.render(level, overlay=overlay)
+        return solving.done and not hints.is_busy()
+
+    def stop_background():
+        EVENT_LOOP.cancel_job(update_solving)
+        EVENT_LOOP.cancel_job(update_hint)
+        solving.cancel()
+        hints.cancel()
+
+    if not update_solving():
+        EVENT_LOOP.add_job(update_solving)
 
     running = True
     while running:
-        render_level(level, display_surf)
-        action = get_action()
+        action = EVENT_LOOP.get_action()
+        if solving.done and solving.error is not None:
+            stop_background()
+            pygame.display.quit()
+            tkinter.messagebox.showerror("Error", "Failed to load level: " + solving.error)
+            return
         if action in [Action.NOTHING, Action.ENTER]:
             continue
         if action == Action.EXIT:
             running = False
             continue
-        if action == Action.RESET:
-            try:
-                level.handle_action(action)
-            except ValueError as e:
-                tkinter.messagebox.showerror("Error", "Failed to reload level: " + str(e))
-                return
-            except Exception as e:
-                tkinter.messagebox.showerror("Error", "An unexpected error occurred: " + str(e))
-                return
-            running = not level.is_win()
+        if action == Action.HINT:
+            hint_text = None
+            if not update_hint() and update_hint not in EVENT_LOOP.jobs:
+                EVENT_LOOP.add_job(update_hint)
             continue
-        if action in [Action.MOVE_UP, Action.MOVE_RIGHT, Action.MOVE_DOWN, Action.MOVE_LEFT]:
+        # the hint is hidden by any other action
+        EVENT_LOOP.cancel_job(update_hint)
+        overlay = None
+        if action in [Action.RESET, Action.UNDO, Action.REDO, Action.MOVE_UP, Action.MOVE_RIGHT, Action.MOVE_DOWN,
+                      Action.MOVE_LEFT]:
             level.handle_action(action)
+            renderer.render(level)
             running = not level.is_win()
             continue
         raise ValueError("Unknown value of action")
+    EVENT_LOOP.cancel_job(update_solving)
+    EVENT_LOOP.cancel_job(update_hint)
+    hints.cancel()
     pygame.display.quit()
-    if level.is_win():
-        tkinter.messagebox.showinfo("Congratulations",
-                                    "You won!\nYour score: " + str(level.moves) + "\nOptimal moves: " + str(
-                                        level.optimal_moves))
+    if not level.is_win():
+        solving.cancel()
+        return
+    # the solution of the player bounds the optimal count of moves until it is proven
+    optimal_moves = "at most " + str(level.moves) + " (still computing)"
+    if solving.poll(SCORE_WAIT) and solving.error is None:
+        optimal_moves = str(level.optimal_moves)
+    elif solving.best is not None and solving.best < level.moves:
+        optimal_moves = "at most " + str(solving.best) + " (best found so far)"
+    solving.cancel()
+    tkinter.messagebox.showinfo("Congratulations",
+                                "You won!\nYour score: " + str(level.moves) + "\nOptimal moves: " + optimal_moves)
 
 
 def ask_new_size() -> (int, int):
     """Asks the user for a new size for the level"""
     new_width = 0
-    while new_width <= 0 or new_width >= 20:
+    while new_width <= 0 or new_width > constants.MAX_SIZE:
         new_width = tkinter.simpledialog.askinteger("Resizing dialog", "Please enter new width:")
         if new_width is None:
             return -1, -1
 
     new_height = 0
-    while new_height <= 0 or new_height >= 20:
+    while new_height <= 0 or new_height > constants.MAX_SIZE:
         new_height = tkinter.simpledialog.askinteger("Resizing dialog", "Please enter new height:")
         if new_height is None:
             return -1, -1
@@ -183,16 +204,46 @@ def resize_matrix(matrix: np.ndarray, new_size: (int, int)) -> np.ndarray:
     return matrix
 
 
+def get_status_overlay(string: str) -> Surface:
+    """Renders a status text onto a dark box drawn over the level"""
+    text_surf = get_text_surface(string, 20)
+    overlay = Surface((text_surf.get_width() + 8, text_surf.get_height() + 4))
+    overlay.fill((0, 0, 0))
+    overlay.blit(text_surf, (4, 2))
+    return overlay
+
+
 def edit_level(level: Level):
-    """Lets user edit a level"""
+    """Lets user edit a level, the level is validated in the background after every edit"""
     display_surf = get_new_display_surf(level.matrix.shape)
     pygame.display.set_caption("Sokoban - Editing a level")
-
-    selection_pos = np.zeros(2, np.int8)
+    renderer = LevelRenderer(display_surf)
+    validator = LiveValidator()
+    overlay = get_status_overlay(validator.status)
+    edited_hash = None
+
+    def update_validation() -> bool:
+        nonlocal overlay
+        if validator.poll():
+            overlay = get_status_overlay(validator.status)
+        return not validator.is_busy()
+
+    history = EditHistory()
+    selection_pos = np.zeros(2, constants.POSITION)
+    events = []
     running = True
     while running:
-        render_level(level, display_surf, selection_pos)
-        for event in pygame.event.get():
+        # the level is hashed only after key presses, frames of the validation job stay cheap in large levels
+        if (edited_hash is None or any(event.type == pygame.KEYDOWN for event in events)) and \
+                level.get_hash() != edited_hash:
+            edited_hash = level.get_hash()
+            validator.edited(level)
+            overlay = get_status_overlay(validator.status)
+            if update_validation not in EVENT_LOOP.jobs:
+                EVENT_LOOP.add_job(update_validation)
+        renderer.render(level, selection_pos, overlay)
+        events = EVENT_LOOP.wait()
+        for event in events:
             if event.type == pygame.QUIT:
                 running = False
                 break
@@ -216,12 +267,22 @@ def edit_level(level: Level):
                     if selection_pos[1] < level.matrix.shape[1] - 1:
                         selection_pos[1] += 1
                     continue
-                if event.key == pygame.K_r:
-                    new_size = ask_new_size()
-                    if new_size[0] == -1:
-                        continue
-                    level.matrix = resize_matrix(level.matrix.copy(), new_size)
-                    display_surf = get_new_display_surf(level.matrix.shape)
+                if event.key in [pygame.K_r, pygame.K_z, pygame.K_u, pygame.K_y]:
+                    shape = level.matrix.shape
+                    if event.key == pygame.K_r:
+                        new_size = ask_new_size()
+                        if new_size[0] != -1:
+                            history.edit(level, "matrix", resize_matrix(level.matrix.copy(), new_size))
+                    elif event.key == pygame.K_y:
+                        history.redo(level)
+                    else:
+                        history.undo(level)
+                    if level.matrix.shape != shape:
+                        # the selection stays inside the resized level
+                        selection_pos = np.minimum(selection_pos, np.array(level.matrix.shape) - 1)
+                        selection_pos = selection_pos.astype(constants.POSITION)
+                        display_surf = get_new_display_surf(level.matrix.shape)
+                        renderer = LevelRenderer(display_surf)
                     continue
                 pos = tuple(selection_pos)
                 if event.key == pygame.K_w:
@@ -229,13 +290,13 @@ def edit_level(level: Level):
                         continue
                     if pos in level.game_status.box_pos:
                         continue
-                    level.matrix[pos] = constants.WALL
+                    history.edit(level, "cell", constants.WALL, pos)
                     continue
                 if event.key == pygame.K_d:
-                    level.matrix[pos] = constants.DESTINATION
+                    history.edit(level, "cell", constants.DESTINATION, pos)
                     continue
                 if event.key == pygame.K_n:
-                    level.matrix[pos] = constants.NOTHING
+                    history.edit(level, "cell", constants.NOTHING, pos)
                     continue
                 if event.key == pygame.K_b:
                     if level.matrix[pos] == constants.WALL:
@@ -247,15 +308,17 @@ def edit_level(level: Level):
                         new_box_pos.remove(pos)
                     else:
                         new_box_pos.add(pos)
-                    level.game_status.box_pos = frozenset(new_box_pos)
+                    history.edit(level, "boxes", frozenset(new_box_pos))
                     continue
                 if event.key == pygame.K_p:
                     if level.matrix[pos] == constants.WALL:
                         continue
                     if pos in level.game_status.box_pos:
                         continue
-                    level.game_status.player_pos = selection_pos.copy()
+                    history.edit(level, "player", selection_pos.copy())
                     continue
+    EVENT_LOOP.cancel_job(update_validation)
+    validator.close()
 
     while level.filepath == "":
         new_path = tkinter.simpledialog.askstring("Sokoban dialogue", "Please enter a name for the level")
@@ -264,6 +327,7 @@ def edit_level(level: Level):
         level.filepath = "./levels/" + new_path + ".lvl"
     try:
         level.save()
+        LEVEL_INDEX.update(level)
     except Exception as e:
         tkinter.messagebox.showerror("Error", "An unexpected exception occurred: " + str(e))
 
@@ -274,11 +338,15 @@ def choice_menu(menu_name: str, choices: list) -> int:
     pygame.display.set_caption("Sokoban")
 
     current_choice = 0
+    rendered = None
     running = True
     while running:
-        render_choice_menu(menu_name, choices, current_choice, display_surf)
-        action = get_action()
-        if action in [Action.NOTHING, Action.MOVE_LEFT, Action.MOVE_RIGHT]:
+        # re-render only when the selection or the choices change
+        if rendered != (current_choice, choices):
+            render_choice_menu(menu_name, choices, current_choice, display_surf)
+            rendered = (current_choice, list(choices))
+        action = EVENT_LOOP.get_action()
+        if action in [Action.NOTHING, Action.MOVE_LEFT, Action.MOVE_RIGHT, Action.HINT, Action.UNDO, Action.REDO]:
             continue
         if action == Action.EXIT:
             running = False
@@ -304,17 +372,34 @@ def choice_menu(menu_name: str, choices: list) -> int:
 
 
 def choose_level_play():
-    """Lets user choose a level to play or to go back"""
-    choices = [f.stem for f in Path("./levels").iterdir() if f.is_file() and f.name.endswith(".lvl")]
+    """Lets user choose a level or a level of a pack to play or to go back, levels are sorted by difficulty"""
+    entries = sorted(LEVEL_INDEX.scan("./levels"), key=get_difficulty)
+    packs = sorted(f for f in Path("./levels").iterdir() if f.is_file() and f.suffix in PACK_SUFFIXES)
+    choices = [get_label(entry) for entry in entries] + [f.stem + " (pack)" for f in packs]
     choices.insert(0, "Go back")
     choice = choice_menu("Choose level", choices)
+    if choice <= 0:
+        return
+    if choice <= len(entries):
+        play_level(entries[choice - 1]["path"])
+        return
+    chosen = packs[choice - 1 - len(entries)]
+    try:
+        pack = open_pack("./levels/" + chosen.name)
+    except (OSError, ValueError) as e:
+        tkinter.messagebox.showerror("Error", "Failed to open pack: " + str(e))
+        return
+    choices = pack.get_titles()
+    choices.insert(0, "Go back")
+    choice = choice_menu(chosen.stem, choices)
     if choice > 0:
-        play_level("./levels/" + choices[choice] + ".lvl")
+        play_level("./levels/" + chosen.name, choice - 1)
 
 
 def choose_level_edit():
     """Lets user choose which level to edit or to create a new level or go back"""
-    choices = [f.stem for f in Path("./levels").iterdir() if f.is_file() and f.name.endswith(".lvl")]
+    entries = LEVEL_INDEX.scan("./levels")
+    choices = [get_label(entry) for entry in entries]
     choices.insert(0, "Go back")
     choices.insert(1, "Create new")
     choice = choice_menu("Choose level", choices)
@@ -323,7 +408,7 @@ def choose_level_edit():
     to_edit = Level(False)
     if choice != 1:
         try:
-            to_edit = Level(False, "./levels/" + choices[choice] + ".lvl")
+            to_edit = Level(False, entries[choice - 2]["path"])
         except ValueError as e:
             tkinter.messagebox.showerror("Error", "Failed to load level: " + str(e))
             return
@@ -348,4 +433,5 @@ def main():
     pygame.quit()
 
 
-main()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Collections of many levels in one XSB/SOK file, read lazily through a memory map and an index of byte offsets"""
+
+import hashlib
+import json
+import mmap
+import os
+from pathlib import Path
+
+PACK_SUFFIXES = (".xsb", ".sok")
+BOARD_CHARS = frozenset(b"#@+$*.-_ ")
+DEFAULT_INDEX_DIRECTORY = "./.pack_index"
+LVL_TO_XSB = str.maketrans("PB", "+*")
+
+
+def is_board_line(line: bytes) -> bool:
+    """Checks whether a line of a pack is a row of a level"""
+    return b"#" in line and BOARD_CHARS.issuperset(line)
+
+
+def build_index(data) -> list:
+    """Scans the pack for levels, returns the start and end offset and the title of every level
+
+    A level is a run of consecutive board rows. Its title is taken from a "Title:" line after it, otherwise from the
+    last line before it that is not metadata."""
+    index = []
+    pos = 0
+    size = len(data)
+    block_start = -1
+    block_end = -1
+    last_text = None
+    while pos <= size:
+        end = data.find(b"\n", pos)
+        if end == -1:
+            end = size
+        line = data[pos:end].rstrip(b"\r")
+        if is_board_line(line):
+            if block_start == -1:
+                block_start = pos
+            block_end = end
+        else:
+            if block_start != -1:
+                index.append([block_start, block_end, last_text or "Level " + str(len(index) + 1)])
+                block_start = -1
+                last_text = None
+            text = line.decode("utf-8", "replace").strip()
+            key, _, value = text.partition(":")
+            if key.lower() == "title" and index and last_text is None:
+                index[-1][2] = value.strip()
+            elif text and not (value and key.isalpha()):
+                # metadata such as "Author: ..." is not a title
+                last_text = text.lstrip(";").strip()
+        pos = end + 1
+    if block_start != -1:
+        index.append([block_start, block_end, last_text or "Level " + str(len(index) + 1)])
+    return index
+
+
+class LevelPack:
+    """Pack of levels in one file, opening a level only reads its own bytes
+
+    The index of byte offsets is built once and stored in index_directory, keyed by the path, size and modification
+    time of the pack, so that it is rebuilt only if the pack changes."""
+
+    def __init__(self, filepath: str, index_directory: str = DEFAULT_INDEX_DIRECTORY):
+        self.filepath = filepath
+        stat = os.stat(filepath)
+        self.size = stat.st_size
+        self.mtime_ns = stat.st_mtime_ns
+        self.index_directory = None if index_directory is None else Path(index_directory)
+        self.data = None
+        if self.size > 0:
+            with open(filepath, 'rb') as file:
+                self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.index = self.load_index()
+
+    def get_index_filepath(self) -> Path:
+        """Gets the path of the file storing the index"""
+        name = hashlib.sha1(os.path.abspath(self.filepath).encode("utf-8")).hexdigest()
+        return self.index_directory / (name + ".json")
+
+    def load_index(self) -> list:
+        """Loads the stored index, or builds and stores it if the pack changed"""
+        if self.data is None:
+            return []
+        if self.index_directory is not None:
+            try:
+                with open(self.get_index_filepath(), 'r', encoding="utf-8") as file:
+                    stored = json.load(file)
+                if stored["size"] == self.size and stored["mtime_ns"] == self.mtime_ns:
+                    return stored["levels"]
+            except (OSError, ValueError, KeyError):
+                pass
+        index = build_index(self.data)
+        if self.index_directory is not None:
+            try:
+                self.index_directory.mkdir(parents=True, exist_ok=True)
+                with open(self.get_index_filepath(), 'w', encoding="utf-8") as file:
+                    json.dump({"size": self.size, "mtime_ns": self.mtime_ns, "levels": index}, file)
+            except OSError:
+                pass
+        return index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def get_titles(self) -> list:
+        """Gets the titles of all levels"""
+        return [title for _, _, title in self.index]
+
+    def get_lines(self, number: int) -> list:
+        """Gets the rows of a level"""
+        if number < 0 or number >= len(self.index):
+            raise ValueError("Level " + str(number) + " is not in the pack")
+        start, end, _ = self.index[number]
+        return self.data[start:end].decode("utf-8").splitlines()
+
+
+def write_pack(filepath: str, levels: list):
+    """Writes levels given as titles and texts of .lvl files into a pack, each title on a line before its level"""
+    with open(filepath, 'w', encoding="utf-8") as file:
+        for title, text in levels:
+            file.write("; " + title + "\n")
+            # the .lvl characters of a player or a box on a destination differ from XSB
+            file.write(text.translate(LVL_TO_XSB).rstrip("\n") + "\n\n")
+
+
+_packs = {}
+
+
+def open_pack(filepath: str) -> LevelPack:
+    """Opens a pack, packs that did not change since they were last opened are reused"""
+    stat = os.stat(filepath)
+    pack = _packs.get(filepath)
+    if pack is None or pack.size != stat.st_size or pack.mtime_ns != stat.st_mtime_ns:
+        pack = LevelPack(filepath)
+        _packs[filepath] = pack
+    return pack
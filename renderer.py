@@ -0,0 +1,180 @@
+"""Renderer of levels that loads the assets once and redraws only the cells that changed"""
+
+import numpy as np
+import pygame
+from pygame.surface import Surface
+
+import constants
+from level import Level
+
+_assets = {}
+# cells kept between the followed cell and the edge of the view of a scrolled level
+SCROLL_MARGIN = 3
+# pixels of the screen left for the window decorations and panels
+SCREEN_MARGIN = 100
+
+
+def get_assets() -> dict:
+    """Loads and converts the images from assets once, the display mode has to be set already"""
+    if not _assets:
+        for name in ["wall", "dest", "nothing"]:
+            _assets[name] = pygame.image.load("assets/" + name + ".png").convert()
+        for name in ["box", "box_on_dest", "player", "selection"]:
+            _assets[name] = pygame.image.load("assets/" + name + ".png").convert_alpha()
+    return _assets
+
+
+def get_img_size() -> int:
+    """Gets the size of a cell in pixels, images should be square"""
+    if _assets:
+        return _assets["nothing"].get_width()
+    return pygame.image.load("assets/nothing.png").get_width()
+
+
+def get_view_shape(shape: (int, int)) -> (int, int):
+    """Gets the count of columns and rows shown of a level, levels larger than the screen are scrolled"""
+    img_size = get_img_size()
+    width, height = pygame.display.get_desktop_sizes()[0]
+    return (min(shape[0], max((width - SCREEN_MARGIN) // img_size, 1)),
+            min(shape[1], max((height - SCREEN_MARGIN) // img_size, 1)))
+
+
+class LevelRenderer:
+    """Renders levels onto a display surface
+
+    Only the view of the level fitting the display is drawn, the camera follows the player or the selection. Walls,
+    floor and destinations of the view are composed into a cached background. Every frame only the cells whose
+    boxes, player or selection changed are redrawn from the background and only their rectangles are updated."""
+
+    def __init__(self, display_surf: Surface):
+        self.display_surf = display_surf
+        self.assets = get_assets()
+        self.img_size = self.assets["nothing"].get_width()
+        self.background = None
+        # the part of the level matrix drawn onto the background
+        self.matrix = None
+        self.drawn = {}
+        self.overlay = None
+        # the top left cell of the view and the count of its columns and rows
+        self.camera = (0, 0)
+        self.view = (0, 0)
+
+    def get_rect(self, cell: (int, int)) -> pygame.Rect:
+        """Gets the rectangle of a cell on the display"""
+        return pygame.Rect((cell[0] - self.camera[0]) * self.img_size, (cell[1] - self.camera[1]) * self.img_size,
+                           self.img_size, self.img_size)
+
+    def get_cells(self, rect: pygame.Rect) -> list:
+        """Gets the cells of the level matrix covered by a rectangle of the display"""
+        if self.matrix is None:
+            return []
+        last_col = min((rect.right - 1) // self.img_size, self.view[0] - 1)
+        last_row = min((rect.bottom - 1) // self.img_size, self.view[1] - 1)
+        cols = range(max(rect.left // self.img_size, 0), last_col + 1)
+        rows = range(max(rect.top // self.img_size, 0), last_row + 1)
+        return [(col + self.camera[0], row + self.camera[1]) for col in cols for row in rows]
+
+    def is_visible(self, cell: (int, int)) -> bool:
+        """Checks whether a cell is in the view"""
+        return 0 <= cell[0] - self.camera[0] < self.view[0] and 0 <= cell[1] - self.camera[1] < self.view[1]
+
+    def follow(self, shape: (int, int), cell: (int, int)):
+        """Moves the camera the least so that the cell is in the view with a margin, the view is redrawn if it moved"""
+        width, height = self.display_surf.get_size()
+        view = (min(shape[0], width // self.img_size), min(shape[1], height // self.img_size))
+        camera = []
+        for axis in range(2):
+            margin = min(SCROLL_MARGIN, (view[axis] - 1) // 2)
+            start = min(self.camera[axis], int(cell[axis]) - margin)
+            start = max(start, int(cell[axis]) + margin - view[axis] + 1)
+            camera.append(max(0, min(start, shape[axis] - view[axis])))
+        if tuple(camera) != self.camera or view != self.view:
+            self.camera = tuple(camera)
+            self.view = view
+            self.matrix = None
+
+    def draw_static(self, cell: (int, int), value: int):
+        """Draws the wall, destination or floor of a cell onto the background"""
+        if value == constants.WALL:
+            image = self.assets["wall"]
+        elif value == constants.DESTINATION:
+            image = self.assets["dest"]
+        elif value == constants.NOTHING:
+            image = self.assets["nothing"]
+        else:
+            raise ValueError("Unknown value read from level matrix")
+        self.background.blit(image, self.get_rect(cell))
+
+    def update_background(self, matrix: np.ndarray) -> list:
+        """Updates the background to the view of the matrix, returns the cells that changed or None if it was
+        rebuilt"""
+        col, row = self.camera
+        visible = matrix[col:col + self.view[0], row:row + self.view[1]]
+        if self.matrix is not None and self.matrix.shape == visible.shape:
+            changed = [(i + col, j + row) for i, j in np.argwhere(self.matrix != visible).tolist()]
+            for cell in changed:
+                self.draw_static(cell, matrix[cell])
+            self.matrix = visible.copy()
+            return changed
+        self.background = Surface(self.display_surf.get_size()).convert()
+        self.background.fill((0, 0, 0))
+        for i, column in enumerate(visible.tolist()):
+            for j, value in enumerate(column):
+                self.draw_static((i + col, j + row), value)
+        self.matrix = visible.copy()
+        return None
+
+    def get_layers(self, to_render: Level, selection_pos: np.array) -> dict:
+        """Gets the images drawn over the background of every cell in the view"""
+        layers = {}
+        for box_pos in to_render.game_status.box_pos:
+            if self.is_visible(box_pos):
+                on_dest = to_render.matrix[box_pos] == constants.DESTINATION
+                layers[(int(box_pos[0]), int(box_pos[1]))] = ("box_on_dest" if on_dest else "box",)
+        player_pos = (int(to_render.game_status.player_pos[0]), int(to_render.game_status.player_pos[1]))
+        if self.is_visible(player_pos):
+            layers[player_pos] = layers.get(player_pos, ()) + ("player",)
+        if selection_pos[0] != -1:
+            selection = (int(selection_pos[0]), int(selection_pos[1]))
+            layers[selection] = layers.get(selection, ()) + ("selection",)
+        return layers
+
+    def render(self, to_render: Level, selection_pos: np.array = np.array([-1]), overlay: Surface = None) -> list:
+        """Renders a level, returns the rectangles that were updated
+
+        The overlay, if given, is drawn over the top left corner of the view."""
+        if self.background is not None and self.background.get_size() != self.display_surf.get_size():
+            self.matrix = None
+        self.follow(to_render.matrix.shape, to_render.game_status.player_pos if selection_pos[0] == -1 else
+                    selection_pos)
+        changed = self.update_background(to_render.matrix)
+        layers = self.get_layers(to_render, selection_pos)
+        if changed is None:
+            dirty = set(layers)
+            self.display_surf.blit(self.background, (0, 0))
+        else:
+            dirty = set(changed)
+            dirty.update(cell for cell, drawn in self.drawn.items() if layers.get(cell) != drawn)
+            dirty.update(cell for cell, layer in layers.items() if self.drawn.get(cell) != layer)
+            if overlay is not self.overlay:
+                # the cells under the previous overlay are uncovered, the new overlay is drawn over its cells
+                for changed_overlay in (self.overlay, overlay):
+                    if changed_overlay is not None:
+                        dirty.update(self.get_cells(changed_overlay.get_rect()))
+        rects = []
+        for cell in dirty:
+            rect = self.get_rect(cell)
+            self.display_surf.blit(self.background, rect, rect)
+            for name in layers.get(cell, ()):
+                self.display_surf.blit(self.assets[name], rect)
+            rects.append(rect)
+        if overlay is not None and (changed is None or any(rect.colliderect(overlay.get_rect()) for rect in rects)):
+            self.display_surf.blit(overlay, (0, 0))
+        self.drawn = layers
+        self.overlay = overlay
+        if changed is None:
+            pygame.display.update()
+            return [self.display_surf.get_rect()]
+        if rects:
+            pygame.display.update(rects)
+        return rects
@@ -0,0 +1,108 @@
+"""Headless replay of recorded moves and batch verification of solutions, without a display"""
+
+import multiprocessing
+
+from action import Action
+from board import Board, MOVE_ACTIONS
+from game_status import PackedStatus
+
+# letters of the LURD notation in the order of MOVE_ACTIONS, capital letters mark pushes
+LURD = "urdl"
+LURD_DIRECTIONS = {letter: i % 4 for i, letter in enumerate(LURD + LURD.upper())}
+
+
+def parse_moves(moves) -> list:
+    """Converts moves in the LURD notation or a sequence of move actions to directions in the order of MOVE_ACTIONS
+
+    Whitespace between LURD letters is ignored, the case of the letters is not checked."""
+    if isinstance(moves, str):
+        try:
+            return [LURD_DIRECTIONS[letter] for letter in moves if not letter.isspace()]
+        except KeyError as e:
+            raise ValueError("Invalid move " + repr(e.args[0])) from None
+    directions = []
+    for action in moves:
+        if not isinstance(action, Action) or action not in MOVE_ACTIONS:
+            raise ValueError("Invalid move " + repr(action))
+        directions.append(action.value - Action.MOVE_UP.value)
+    return directions
+
+
+def format_moves(directions: list, pushes: list = None) -> str:
+    """Converts directions to the LURD notation, the moves with indices in pushes are capital letters"""
+    letters = [LURD[direction] for direction in directions]
+    for i in pushes or ():
+        letters[i] = letters[i].upper()
+    return "".join(letters)
+
+
+def replay(board: Board, start: PackedStatus, directions: list, first_move: int = 0) -> dict:
+    """Applies directions to a status, stops at the first move that is not possible
+
+    Returns a report with the final status, the count of applied moves and pushes, the applied moves in the LURD
+    notation, whether every move was possible and whether the final status is winning. Moves in the error are numbered
+    from first_move + 1."""
+    walls = board.walls
+    offsets = board.offsets
+    player = start.player
+    boxes = start.boxes
+    pushes = []
+    error = None
+    moves = 0
+    for direction in directions:
+        offset = offsets[direction]
+        new_player = player + offset
+        if walls[new_player]:
+            error = "Move " + str(first_move + moves + 1) + " walks into a wall"
+            break
+        if boxes >> new_player & 1:
+            new_box = new_player + offset
+            if walls[new_box] or boxes >> new_box & 1:
+                error = "Move " + str(first_move + moves + 1) + " pushes a blocked box"
+                break
+            boxes ^= 1 << new_player | 1 << new_box
+            pushes.append(moves)
+        player = new_player
+        moves += 1
+    status = PackedStatus(player, boxes)
+    return {"status": status, "moves": moves, "pushes": len(pushes), "lurd": format_moves(directions[:moves], pushes),
+            "valid": error is None, "solved": error is None and board.is_win(status), "error": error}
+
+
+def verify(board: Board, start: PackedStatus, moves, optimal_moves: int = -1, first_move: int = 0) -> dict:
+    """Replays a recorded solution, the report tells whether it is valid, solves the level and is optimal
+
+    Moves in an invalid notation are reported as invalid, optimal is None if the optimal count of moves is unknown.
+    Moves in the error are numbered from first_move + 1, e.g. for a part of a longer solution."""
+    try:
+        report = replay(board, start, parse_moves(moves), first_move)
+    except ValueError as e:
+        report = {"status": start, "moves": 0, "pushes": 0, "lurd": "", "valid": False, "solved": False,
+                  "error": str(e)}
+    report["status"] = board.unpack(report["status"])
+    report["optimal"] = None if optimal_moves < 0 else report["solved"] and report["moves"] == optimal_moves
+    return report
+
+
+_shared = {}
+
+
+def _init_worker(board: Board, start: PackedStatus, optimal_moves: int):
+    """Stores the level in a worker process of the pool, so that it is sent only once"""
+    _shared["args"] = (board, start)
+    _shared["optimal_moves"] = optimal_moves
+
+
+def _verify_shared(moves) -> dict:
+    """Verifies a solution against the level of the worker process"""
+    return verify(*_shared["args"], moves, _shared["optimal_moves"])
+
+
+def verify_batch(board: Board, start: PackedStatus, solutions: list, optimal_moves: int = -1,
+                 jobs: int = 1) -> list:
+    """Verifies many recorded solutions against one level, in a pool of jobs processes if jobs is more than 1"""
+    if jobs <= 1 or len(solutions) < 2:
+        return [verify(board, start, moves, optimal_moves) for moves in solutions]
+    chunk_size = max(1, len(solutions) // (jobs * 4))
+    with multiprocessing.Pool(jobs, _init_worker, (board, start, optimal_moves)) as pool:
+        return pool.map(_verify_shared, solutions, chunk_size)
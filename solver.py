@@ -0,0 +1,615 @@
+"""Solver engines that find the optimal count of moves to solve a level"""
+
+import heapq
+import time
+from collections import deque
+
+import numpy as np
+
+from board import Board, iter_cells
+from deadlock import DeadlockDetector
+from frontier import KeySet, StateCodec
+from game_status import PackedStatus
+from heuristic import MatchingHeuristic
+from transposition import TranspositionTable, ZobristKeys
+
+# rough size of a state kept by the search, with its table entry
+STATE_BYTES = 200
+# memory used by the bounded engine if there is no budget
+DEFAULT_TABLE_BYTES = 32 * 1024 * 1024
+# rough size of an entry of the open list of the bounded engine
+OPEN_ENTRY_BYTES = 150
+# states of a layer expanded at once by the batched engine
+BATCH_SIZE = 1 << 16
+# weights of the heuristic in the searches of the anytime solver, the last search is exact
+ANYTIME_WEIGHTS = (3, 2.5, 2, 1.5, 1)
+# expanded states between checks of the limits of the anytime solver
+ANYTIME_INTERVAL = 1000
+
+
+class SolverLimit(Exception):
+    """Raised in the anytime solver once its time or node limit is reached"""
+
+
+class SolverStats:
+    """Counters of the work done by a solver engine
+
+    Besides the expanded and generated states it counts the duplicates, the states pruned for every reason and the
+    states generated at every depth, which is the frontier of the breadth first engines. If callback is set, it is
+    called with the stats after every interval expanded states and once the search ends."""
+
+    def __init__(self, callback=None, interval: int = 10000):
+        self.expanded = 0
+        self.generated = 0
+        self.duplicates = 0
+        self.pruned = {}
+        self.frontier = []
+        # states kept by the search and the memory they take, updated with every expanded state
+        self.states = 0
+        self.state_bytes = STATE_BYTES
+        self.base_bytes = 0
+        self.elapsed = 0.0
+        self.result = None
+        self.callback = callback
+        self.interval = interval
+        self.next_report = interval if callback is not None else float("inf")
+        self.started = None
+
+    @property
+    def memory(self) -> int:
+        """Estimate of the bytes taken by the states kept by the search"""
+        return self.base_bytes + self.states * self.state_bytes
+
+    def start(self):
+        """Starts measuring the elapsed time"""
+        self.started = time.perf_counter()
+
+    def expand(self, states: int, count: int = 1):
+        """Counts expanded states, states is the count of states kept by the search"""
+        self.expanded += count
+        self.states = states
+        if self.expanded >= self.next_report:
+            self.report()
+
+    def generate(self, depth: int, count: int = 1):
+        """Counts states generated at a depth"""
+        self.generated += count
+        frontier = self.frontier
+        while len(frontier) <= depth:
+            frontier.append(0)
+        frontier[depth] += count
+
+    def prune(self, reason: str, count: int = 1):
+        """Counts states pruned for a reason"""
+        self.pruned[reason] = self.pruned.get(reason, 0) + count
+
+    def report(self):
+        """Updates the elapsed time and calls the callback"""
+        if self.started is not None:
+            self.elapsed = time.perf_counter() - self.started
+        self.next_report = self.expanded + self.interval
+        if self.callback is not None:
+            self.callback(self)
+
+    def finish(self, result):
+        """Records the result of the search, None if it failed, and reports for the last time"""
+        self.result = result
+        self.next_report = float("inf")
+        if self.started is not None:
+            self.elapsed = time.perf_counter() - self.started
+        if self.callback is not None:
+            self.callback(self)
+
+    def as_dict(self) -> dict:
+        """Gets the counters in a form that can be logged as JSON"""
+        return {"expanded": self.expanded, "generated": self.generated, "duplicates": self.duplicates,
+                "pruned": dict(self.pruned), "frontier": list(self.frontier), "memory": self.memory,
+                "elapsed": round(self.elapsed, 6), "result": self.result}
+
+
+class SolverBudget:
+    """Limits of the resources a solver engine may use, 0 means no limit"""
+
+    def __init__(self, memory: int = 0):
+        self.memory = memory
+
+    def check_memory(self, states: int, state_bytes: int = STATE_BYTES):
+        """Raises an error if the states kept by the search do not fit into the memory budget"""
+        if self.memory and states * state_bytes > self.memory:
+            raise ValueError("Memory budget exceeded")
+
+
+def bfs(board: Board, start: PackedStatus, detector: DeadlockDetector, stats: SolverStats,
+        budget: SolverBudget) -> int:
+    """Breadth first search over player moves"""
+    walls = board.walls
+    visited = {start: 0}
+    queue = deque([start])
+    while queue:
+        visiting = queue.popleft()
+        if visiting.boxes == board.dest_mask:
+            return visited[visiting]
+        stats.expand(len(visited))
+        budget.check_memory(len(visited))
+        depth = visited[visiting] + 1
+        for offset in board.offsets:
+            to_visit = visiting.move(offset, walls)
+            if to_visit in visited:
+                stats.duplicates += 1
+                continue
+            if to_visit.boxes != visiting.boxes and detector.is_dead_push(to_visit.boxes, to_visit.player + offset):
+                continue
+            stats.generate(depth)
+            queue.append(to_visit)
+            visited[to_visit] = depth
+    return -1
+
+
+def expand_layer(board: Board, walls: np.ndarray, dead: np.ndarray, players: np.ndarray, boxes: np.ndarray,
+                 stats: SolverStats) -> tuple:
+    """Applies every move to arrays of states, returns the players and the sorted boxes of the possible moves"""
+    new_players = []
+    new_boxes = []
+    for offset in board.offsets:
+        targets = players + offset
+        on_box = boxes == targets[:, None]
+        pushed = on_box.any(axis=1)
+        # the cells behind walls are not used, they are only kept inside the board
+        behind = np.clip(targets + offset, 0, board.size - 1)
+        blocked = walls[behind] | (boxes == behind[:, None]).any(axis=1)
+        to_dead = pushed & ~walls[targets] & ~blocked & dead[behind]
+        stats.prune("dead square", int(to_dead.sum()))
+        valid = ~walls[targets] & ~(pushed & (blocked | dead[behind]))
+        moved = np.where(on_box, behind[:, None], boxes)[valid]
+        # only the rows with a pushed box may need sorting
+        pushed = pushed[valid]
+        moved[pushed] = np.sort(moved[pushed], axis=1)
+        new_players.append(targets[valid])
+        new_boxes.append(moved)
+    return np.concatenate(new_players), np.concatenate(new_boxes)
+
+
+def batch_bfs(board: Board, start: PackedStatus, detector: DeadlockDetector, stats: SolverStats,
+              budget: SolverBudget) -> int:
+    """Breadth first search over player moves that expands a layer of states at once with array operations
+
+    States are arrays of player cells and sorted box cells, duplicates are found by their packed keys. Pushes to dead
+    squares are pruned, the other checks of the detector are skipped as they handle one state at a time."""
+    walls = np.array(board.walls)
+    dead = np.array(detector.dead)
+    dests = np.zeros(board.size, bool)
+    dests[list(iter_cells(board.dest_mask))] = True
+    box_cells = list(iter_cells(start.boxes))
+    codec = StateCodec(board, len(box_cells))
+    # a visited key and the row of a state in the frontier
+    state_bytes = codec.key_bytes + 8 * (len(box_cells) + 1)
+    stats.state_bytes = state_bytes
+    players = np.array([start.player], np.int64)
+    boxes = np.array(box_cells, np.int64).reshape(1, len(box_cells))
+    visited = KeySet()
+    visited.add(codec.encode(players, boxes))
+    depth = 0
+    while len(players):
+        if dests[boxes].all(axis=1).any():
+            return depth
+        depth += 1
+        next_players = []
+        next_boxes = []
+        for first in range(0, len(players), BATCH_SIZE):
+            stats.expand(visited.size, len(players[first:first + BATCH_SIZE]))
+            budget.check_memory(visited.size, state_bytes)
+            new_players, new_boxes = expand_layer(board, walls, dead, players[first:first + BATCH_SIZE],
+                                                  boxes[first:first + BATCH_SIZE], stats)
+            keys, rows = np.unique(codec.encode(new_players, new_boxes), return_index=True)
+            fresh = ~visited.contains(keys)
+            stats.duplicates += len(new_players) - int(fresh.sum())
+            visited.add(keys[fresh])
+            rows = rows[fresh]
+            stats.generate(depth, len(rows))
+            next_players.append(new_players[rows])
+            next_boxes.append(new_boxes[rows])
+        players = np.concatenate(next_players)
+        boxes = np.concatenate(next_boxes)
+    return -1
+
+
+def astar(board: Board, start: PackedStatus, detector: DeadlockDetector, stats: SolverStats,
+          budget: SolverBudget) -> int:
+    """A* search over player moves guided by the box to destination matching heuristic and the walk to the nearest
+    box"""
+    heuristic = MatchingHeuristic(board)
+    start_h = heuristic.moves(start.player, start.boxes)
+    if start_h is None:
+        return -1
+    walls = board.walls
+    best = {start: 0}
+    counter = 0
+    # ties are broken towards deeper states, then by insertion order
+    heap = [(start_h, 0, counter, start)]
+    while heap:
+        _, neg_depth, _, visiting = heapq.heappop(heap)
+        depth = -neg_depth
+        if best[visiting] < depth:
+            stats.duplicates += 1
+            continue
+        if visiting.boxes == board.dest_mask:
+            return depth
+        stats.expand(len(best))
+        budget.check_memory(len(best))
+        depth += 1
+        for offset in board.offsets:
+            to_visit = visiting.move(offset, walls)
+            if to_visit in best and best[to_visit] <= depth:
+                stats.duplicates += 1
+                continue
+            if to_visit.boxes != visiting.boxes and detector.is_dead_push(to_visit.boxes, to_visit.player + offset):
+                continue
+            to_visit_h = heuristic.moves(to_visit.player, to_visit.boxes)
+            if to_visit_h is None:
+                stats.prune("unmatched")
+                continue
+            best[to_visit] = depth
+            stats.generate(depth)
+            counter += 1
+            heapq.heappush(heap, (depth + to_visit_h, -depth, counter, to_visit))
+    return -1
+
+
+def push_search(board: Board, start: PackedStatus, detector: DeadlockDetector, stats: SolverStats,
+                budget: SolverBudget, parents: dict = None, known: dict = None, weight: float = 1,
+                upper: int = None) -> int:
+    """A* search over box pushes, each push is weighted by the walk before it plus the push itself
+
+    States are grouped by the player's reachable region, represented by its canonical cell (leftmost column, then
+    topmost row). A state is skipped when a state with the same boxes and region was already expanded and its player
+    can walk to the current player position without exceeding the current count of moves.
+
+    If parents is given, every state gets the state it was reached from and None gets the last state of the solution.
+    States in known have an exact remaining count of moves, the search stops once no open state can do better than
+    continuing from one of them. A weight above 1 multiplies the heuristic, which finds a solution sooner but not
+    necessarily an optimal one. If upper is given, only solutions with fewer moves are looked for."""
+    if known is not None and start in known:
+        if parents is not None:
+            parents[None] = start
+        return known[start]
+    heuristic = MatchingHeuristic(board)
+    start_h = heuristic(start.boxes)
+    if start_h is None or (upper is not None and start_h >= upper):
+        return -1
+    walls = board.walls
+    best = {start: 0}
+    expanded = {}
+    counter = 0
+    # the best solution through a known state, its count of moves and the known state
+    bound = None
+    heap = [(start_h, 0, counter, start)]
+    while heap:
+        estimate, neg_depth, _, visiting = heapq.heappop(heap)
+        if bound is not None and bound[0] <= estimate:
+            break
+        depth = -neg_depth
+        if best[visiting] < depth:
+            stats.duplicates += 1
+            continue
+        if visiting.boxes == board.dest_mask:
+            if parents is not None:
+                parents[None] = visiting
+            return depth
+        boxes = visiting.boxes
+        distances = board.walk_distances(visiting.player, boxes)
+        region = expanded.setdefault((min(distances), boxes), [])
+        if any(region_depth + distances[region_player] <= depth for region_player, region_depth in region):
+            stats.duplicates += 1
+            continue
+        region.append((visiting.player, depth))
+        if detector.is_corral_deadlock(distances, boxes):
+            continue
+        stats.expand(len(best))
+        budget.check_memory(len(best))
+        for box in iter_cells(boxes):
+            for offset in board.offsets:
+                distance = distances.get(box - offset)
+                if distance is None:
+                    continue
+                target = box + offset
+                if walls[target] or boxes >> target & 1:
+                    continue
+                to_visit = PackedStatus(box, boxes ^ (1 << box) | (1 << target))
+                to_visit_depth = depth + distance + 1
+                if to_visit in best and best[to_visit] <= to_visit_depth:
+                    stats.duplicates += 1
+                    continue
+                if detector.is_dead_push(to_visit.boxes, target):
+                    continue
+                to_visit_h = heuristic(to_visit.boxes)
+                if to_visit_h is None:
+                    stats.prune("unmatched")
+                    continue
+                if upper is not None and to_visit_depth + to_visit_h >= upper:
+                    stats.prune("bound")
+                    continue
+                best[to_visit] = to_visit_depth
+                if parents is not None:
+                    parents[to_visit] = visiting
+                if known is not None and to_visit in known:
+                    total = to_visit_depth + known[to_visit]
+                    if bound is None or total < bound[0]:
+                        bound = (total, to_visit)
+                stats.generate(to_visit_depth)
+                counter += 1
+                heapq.heappush(heap, (to_visit_depth + weight * to_visit_h, -to_visit_depth, counter, to_visit))
+    if bound is None:
+        return -1
+    if parents is not None:
+        parents[None] = bound[1]
+    return bound[0]
+
+
+def bidirectional(board: Board, start: PackedStatus, detector: DeadlockDetector, stats: SolverStats,
+                  budget: SolverBudget) -> int:
+    """Bidirectional breadth first search over player moves
+
+    The forward search starts at the start status, the backward search pulls boxes from every winning status. Both
+    share one visited table of forward and backward depths, the smaller frontier is expanded by a whole layer and the
+    search stops at the layer where the two meet, which keeps the count of moves optimal."""
+    walls = board.walls
+    visited = {start: [0, None]}
+    frontiers = [[start], []]
+    for cell in range(board.size):
+        if not walls[cell] and not board.dest_mask >> cell & 1:
+            goal = PackedStatus(cell, board.dest_mask)
+            if goal in visited:
+                return 0
+            visited[goal] = [None, 0]
+            frontiers[1].append(goal)
+    depths = [0, 0]
+    while frontiers[0] and frontiers[1]:
+        direction = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+        depth = depths[direction] + 1
+        best = -1
+        next_frontier = []
+        budget.check_memory(len(visited))
+        for visiting in frontiers[direction]:
+            stats.expand(len(visited))
+            for offset in board.offsets:
+                if direction == 0:
+                    to_visit = visiting.move(offset, walls)
+                    if to_visit.boxes != visiting.boxes and detector.is_dead_push(to_visit.boxes,
+                                                                                  to_visit.player + offset):
+                        continue
+                    to_visits = (to_visit,)
+                else:
+                    to_visits = visiting.unmove(offset, walls)
+                for to_visit in to_visits:
+                    depth_pair = visited.setdefault(to_visit, [None, None])
+                    if depth_pair[direction] is not None:
+                        stats.duplicates += 1
+                        continue
+                    depth_pair[direction] = depth
+                    stats.generate(depth)
+                    next_frontier.append(to_visit)
+                    if depth_pair[1 - direction] is not None:
+                        total = depth + depth_pair[1 - direction]
+                        best = total if best == -1 else min(best, total)
+        if best != -1:
+            return best
+        frontiers[direction] = next_frontier
+        depths[direction] = depth
+    return -1
+
+
+def bounded_astar(board: Board, start: PackedStatus, detector: DeadlockDetector, stats: SolverStats,
+                  budget: SolverBudget) -> int:
+    """A* search over player moves that keeps visited states in a transposition table of bounded size
+
+    States are identified by Zobrist hashes updated with every move and push. The table grows up to half of the memory
+    budget and then replaces old entries when full, so the search only repeats some work instead of growing. The error
+    about the exceeded budget is raised only if the open list does not fit into the rest."""
+    memory = budget.memory if budget.memory else DEFAULT_TABLE_BYTES * 2
+    # the table grows up to half of the memory as states are stored
+    table = TranspositionTable(memory // 2)
+    open_limit = (memory - memory // 2) // OPEN_ENTRY_BYTES
+    stats.state_bytes = OPEN_ENTRY_BYTES
+    heuristic = MatchingHeuristic(board, open_limit // 4)
+    start_h = heuristic(start.boxes)
+    if start_h is None:
+        return -1
+    keys = ZobristKeys(board)
+    player_keys = keys.player
+    box_keys = keys.box
+    walls = board.walls
+    start_key = keys.hash(start)
+    table.store(start_key, 0)
+    heap = [(start_h, 0, start_key, start.player, start.boxes)]
+    while heap:
+        _, neg_depth, key, player, boxes = heapq.heappop(heap)
+        depth = -neg_depth
+        stored = table.get(key)
+        if stored is not None and stored < depth:
+            stats.duplicates += 1
+            continue
+        if boxes == board.dest_mask:
+            return depth
+        stats.base_bytes = table.nbytes
+        stats.expand(len(heap))
+        depth += 1
+        for offset in board.offsets:
+            new_player = player + offset
+            if walls[new_player]:
+                continue
+            new_key = key ^ player_keys[player] ^ player_keys[new_player]
+            new_boxes = boxes
+            if boxes >> new_player & 1:
+                target = new_player + offset
+                if walls[target] or boxes >> target & 1:
+                    continue
+                new_boxes = boxes ^ (1 << new_player) | (1 << target)
+                if detector.is_dead_push(new_boxes, target):
+                    continue
+                new_key ^= box_keys[new_player] ^ box_keys[target]
+            stored = table.get(new_key)
+            if stored is not None and stored <= depth:
+                stats.duplicates += 1
+                continue
+            new_h = heuristic(new_boxes)
+            if new_h is None:
+                stats.prune("unmatched")
+                continue
+            if len(heap) >= open_limit:
+                raise ValueError("Memory budget exceeded")
+            table.store(new_key, depth)
+            stats.generate(depth)
+            heapq.heappush(heap, (depth + new_h, -depth, new_key, new_player, new_boxes))
+    return -1
+
+
+ENGINES = {
+    "bfs": bfs,
+    "batch": batch_bfs,
+    "astar": astar,
+    "push": push_search,
+    "bidirectional": bidirectional,
+    "bounded": bounded_astar,
+}
+
+
+def solve(board: Board, start: PackedStatus, engine: str = "bfs", corrals: bool = False,
+          stats: SolverStats = None, budget: SolverBudget = None) -> int:
+    """Finds the optimal count of moves with the chosen solver engine, -1 if the level is not solvable
+
+    Dead positions are pruned, corral deadlocks are checked too if corrals is set. The work done is counted into
+    stats, if given, and the engine raises an error if it cannot fit into the budget."""
+    if engine not in ENGINES:
+        raise ValueError("Unknown solver engine: " + str(engine))
+    if stats is None:
+        stats = SolverStats()
+    if budget is None:
+        budget = SolverBudget()
+    stats.start()
+    if bin(start.boxes).count("1") != bin(board.dest_mask).count("1"):
+        stats.finish(-1)
+        return -1
+    result = None
+    try:
+        result = ENGINES[engine](board, start, DeadlockDetector(board, corrals, stats), stats, budget)
+    finally:
+        stats.finish(result)
+    return result
+
+
+def solve_path(board: Board, start: PackedStatus, corrals: bool = False, stats: SolverStats = None,
+               budget: SolverBudget = None, known: dict = None, known_moves: dict = None) -> list:
+    """Finds an optimal solution with the push engine, returns its moves as indices of board.offsets, None if the level
+    is not solvable
+
+    known maps states to their exact remaining count of moves and known_moves to the direction of their next move,
+    the solution follows them from the first known state it reaches."""
+    if stats is None:
+        stats = SolverStats()
+    if budget is None:
+        budget = SolverBudget()
+    if known is None:
+        known, known_moves = {}, {}
+    stats.start()
+    if bin(start.boxes).count("1") != bin(board.dest_mask).count("1"):
+        stats.finish(-1)
+        return None
+    parents = {}
+    result = None
+    try:
+        result = push_search(board, start, DeadlockDetector(board, corrals, stats), stats, budget, parents, known)
+    finally:
+        stats.finish(result)
+    if result == -1:
+        return None
+    return get_path(board, start, parents, known, known_moves)
+
+
+def get_path(board: Board, start: PackedStatus, parents: dict, known: dict = None, known_moves: dict = None) -> list:
+    """Rebuilds the solution found by push_search from the parents of its states, as indices of board.offsets, the
+    solution continues by known_moves from its last state while known has a remaining count of moves for it"""
+    chain = [parents[None]]
+    while chain[-1] != start:
+        chain.append(parents[chain[-1]])
+    chain.reverse()
+    directions = []
+    for prev, curr in zip(chain, chain[1:]):
+        # the player stands on the cell the box was pushed from
+        target = (curr.boxes & ~prev.boxes).bit_length() - 1
+        offset = target - curr.player
+        directions += board.walk_path(prev.player, curr.player - offset, prev.boxes)
+        directions.append(board.offsets.index(offset))
+    status = chain[-1]
+    while known is not None and known.get(status, 0) > 0:
+        direction = known_moves[status]
+        directions.append(direction)
+        status = status.move(board.offsets[direction], board.walls)
+    return directions
+
+
+def solve_anytime(board: Board, start: PackedStatus, time_limit: float = 0, node_limit: int = 0,
+                  corrals: bool = False, stats: SolverStats = None, budget: SolverBudget = None,
+                  callback=None) -> dict:
+    """Finds a solution quickly and improves it until it is proven optimal or the time or node limit is reached
+
+    The push engine searches with a heuristic weighted less every time, only for solutions shorter than the best one
+    found, so the last exact search proves the best solution optimal. Returns a report with the count of moves of the
+    best solution, -1 if none was found, its moves as indices of board.offsets, whether it is proven optimal and a
+    lower bound of the optimal count of moves. callback is called with the count of moves of every better solution.
+    The limits are checked every ANYTIME_INTERVAL expanded states, 0 means no limit."""
+    if stats is None:
+        stats = SolverStats()
+    if budget is None:
+        budget = SolverBudget()
+    report = {"moves": -1, "path": None, "proven": True, "lower": 0}
+    stats.start()
+    lower = MatchingHeuristic(board).moves(start.player, start.boxes)
+    if bin(start.boxes).count("1") != bin(board.dest_mask).count("1") or lower is None:
+        stats.finish(-1)
+        return report
+    report["lower"] = lower
+    report["proven"] = False
+    previous = stats.callback
+
+    def check_limits(current: SolverStats):
+        if previous is not None:
+            previous(current)
+        if current.result is None and (time_limit and time.perf_counter() - current.started >= time_limit or
+                                       node_limit and current.expanded >= node_limit):
+            raise SolverLimit()
+
+    stats.callback = check_limits
+    if time_limit or node_limit:
+        stats.interval = min(stats.interval, ANYTIME_INTERVAL)
+    stats.next_report = stats.expanded + stats.interval
+    detector = DeadlockDetector(board, corrals, stats)
+    result = None
+    try:
+        for weight in ANYTIME_WEIGHTS:
+            parents = {}
+            upper = None if report["moves"] == -1 else report["moves"]
+            moves = push_search(board, start, detector, stats, budget, parents, weight=weight, upper=upper)
+            # no shorter solution exists
+            if moves == -1:
+                break
+            report["moves"] = moves
+            report["path"] = get_path(board, start, parents)
+            if callback is not None:
+                callback(moves)
+            if moves == lower:
+                break
+        report["proven"] = True
+        result = report["moves"]
+    except SolverLimit:
+        result = report["moves"]
+    except ValueError:
+        # the memory budget is a limit too, once there is a solution
+        if report["moves"] == -1:
+            raise
+        result = report["moves"]
+    finally:
+        stats.callback = previous
+        stats.finish(result)
+    if report["proven"] and report["moves"] != -1:
+        report["lower"] = report["moves"]
+    return report
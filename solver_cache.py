@@ -0,0 +1,87 @@
+"""Cache of solver results, kept in memory for the session and stored on disk between sessions"""
+
+import json
+import os
+from collections import OrderedDict
+from pathlib import Path
+
+
+class SolverCache:
+    """Cache of solver results keyed by the hash of the level content
+
+    The memory layer keeps the most recently used entries, the disk layer stores one small file per level and
+    evicts the least recently used files once the directory grows over max_bytes."""
+
+    def __init__(self, directory: str = "./.solver_cache", max_bytes: int = 1 << 20, memory_entries: int = 256):
+        self.directory = None if directory is None else Path(directory)
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self.memory = OrderedDict()
+
+    def get_filepath(self, key: str) -> Path:
+        """Gets the path of the file storing the entry"""
+        return self.directory / (key + ".json")
+
+    def get(self, key: str):
+        """Gets the entry with the optimal count of moves and the solution path, None if not cached"""
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            return self.memory[key]
+        if self.directory is None:
+            return None
+        filepath = self.get_filepath(key)
+        try:
+            with open(filepath, 'r', encoding="utf-8") as file:
+                entry = json.load(file)
+            # touch the file, so that it is evicted last
+            os.utime(filepath)
+        except (OSError, ValueError):
+            return None
+        self._remember(key, entry)
+        return entry
+
+    def put(self, key: str, moves: int, path: str = None):
+        """Stores the optimal count of moves and the solution path, if it is known"""
+        entry = {"moves": moves, "path": path}
+        self._remember(key, entry)
+        if self.directory is None:
+            return
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with open(self.get_filepath(key), 'w', encoding="utf-8") as file:
+                json.dump(entry, file)
+            self.evict()
+        except OSError:
+            # the disk layer is only an optimisation, the memory layer still works
+            pass
+
+    def invalidate(self, key: str):
+        """Removes an entry from both layers"""
+        self.memory.pop(key, None)
+        if self.directory is None:
+            return
+        try:
+            self.get_filepath(key).unlink()
+        except OSError:
+            pass
+
+    def evict(self):
+        """Removes the least recently used files until the directory fits into max_bytes"""
+        files = [(f.stat().st_mtime, f.stat().st_size, f) for f in self.directory.iterdir() if f.suffix == ".json"]
+        total = sum(size for _, size, _ in files)
+        for _, size, filepath in sorted(files, key=lambda x: x[0]):
+            if total <= self.max_bytes:
+                break
+            filepath.unlink()
+            self.memory.pop(filepath.stem, None)
+            total -= size
+
+    def _remember(self, key: str, entry: dict):
+        """Stores an entry in the memory layer, forgetting the least recently used one if it is full"""
+        self.memory[key] = entry
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+
+DEFAULT_CACHE = SolverCache()
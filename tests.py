@@ -1,12 +1,40 @@
 """Tests for GameStatus"""
+import itertools
+import json
+import os
+import time
+from pathlib import Path
 import pytest
 
 import numpy as np
+import pygame
+from pygame.surface import Surface
 
 import constants as const
 from action import Action
-from game_status import GameStatus
+from background_solve import CANCEL_TIMEOUT, BackgroundSolve
+from benchmark import compare, format_table as format_benchmarks, get_benchmarks, random_actions, run_benchmark, \
+    synthetic_level
+from board import Board, MOVE_ACTIONS
+from deadlock import DeadlockDetector, dead_squares, get_dead_squares
+from events import EventLoop
+from fonts import FontRegistry
+from frontier import KeySet, StateCodec
+from game_status import GameStatus, PackedStatus
+from generator import generate_level, generate_levels, get_title, pull_search, save_levels, save_pack
+from hint import HintEngine
+from history import CHECKPOINT_INTERVAL, EditHistory
+from heuristic import MatchingHeuristic, get_push_distances, min_matching
 from level import Level
+from level_index import LevelIndex, get_difficulty, get_label
+from live_validation import LiveValidator
+from pack import LevelPack
+from replay import LURD, format_moves, parse_moves, replay
+from renderer import LevelRenderer, get_img_size
+from solver import STATE_BYTES, SolverBudget, SolverStats, solve_anytime, solve_path
+from solver_cache import SolverCache
+from transposition import TranspositionTable, ZobristKeys
+from validate import validate_directory, format_table
 
 
 def test_game_status_copy():
@@ -88,3 +116,772 @@ def test_level_bfs():
     assert Level(False, "./levels/tutorial.lvl").bfs() == 3
     assert Level(False, "./levels/test_levels/too_many_boxes.lvl").bfs() == -1
     assert Level(False, "./levels/test_levels/unsolvable.lvl").bfs() == -1
+
+
+def test_board_pack_unpack():
+    """Tests that converting between GameStatus and PackedStatus keeps the positions"""
+    level = Level(False, "./levels/level3.lvl")
+    board = level.get_board()
+    packed = board.pack(level.game_status)
+    assert board.position(packed.player) == (2, 3)
+    assert board.unpack(packed) == level.game_status
+    assert not board.is_win(packed)
+    assert board.is_win(PackedStatus(packed.player, board.dest_mask))
+
+
+def test_packed_status_handle_action():
+    """Tests that packed status handles actions the same way as game status"""
+    level_matrix = np.zeros((5, 5), np.uint8)
+    level_matrix[2][4] = const.WALL
+    board = Board(level_matrix)
+    for subject in [GameStatus(np.array([2, 0]), {(2, 2)}), GameStatus(np.array([2, 3]), {(2, 1), (2, 2)}),
+                    GameStatus(np.array([0, 0]), {(1, 0)})]:
+        packed = board.pack(subject)
+        for action in [Action.MOVE_DOWN, Action.MOVE_DOWN, Action.MOVE_UP, Action.MOVE_LEFT, Action.MOVE_RIGHT,
+                       Action.MOVE_RIGHT, Action.RESET]:
+            subject = subject.handle_action(action, level_matrix)
+            packed = packed.handle_action(action, board)
+            assert board.unpack(packed) == subject
+
+
+def test_min_matching():
+    """Tests that the assignment heuristic finds the minimal total cost"""
+    assert min_matching([[4, 1, 3], [2, 0, 5], [3, 2, 2]]) == 5
+    assert min_matching([[7]]) == 7
+    assert min_matching([]) == 0
+
+
+def test_level_astar():
+    """Tests that A* finds the same optimal count of moves as bfs"""
+    for filepath in ["./levels/tutorial.lvl", "./levels/level1.lvl", "./levels/level2.lvl", "./levels/level3.lvl"]:
+        level = Level(False, filepath)
+        assert level.solve("astar") == level.bfs()
+    assert Level(False, "./levels/test_levels/too_many_boxes.lvl").solve("astar") == -1
+    assert Level(False, "./levels/test_levels/unsolvable.lvl").solve("astar") == -1
+
+    # the walk to the nearest box adds to the pushes, the bound stays below the optimal count of moves
+    level = Level(False, "./levels/level2.lvl")
+    board = level.get_board()
+    start = board.pack(level.game_status)
+    heuristic = MatchingHeuristic(board)
+    assert heuristic(start.boxes) <= heuristic.moves(start.player, start.boxes) <= 53
+    assert heuristic.moves(start.player, board.dest_mask) == 0
+    with pytest.raises(ValueError):
+        Level(False, "./levels/tutorial.lvl").solve("nonexistent")
+
+
+def test_level_push_search():
+    """Tests that the push search finds the same optimal count of moves as bfs"""
+    for filepath in ["./levels/tutorial.lvl", "./levels/level1.lvl", "./levels/level2.lvl", "./levels/level3.lvl"]:
+        level = Level(False, filepath)
+        assert level.solve("push") == level.bfs()
+    assert Level(False, "./levels/test_levels/unsolvable.lvl").solve("push") == -1
+
+
+def test_deadlock_detector():
+    """Tests dead squares, freeze deadlocks and corral deadlocks"""
+    level = Level(False, "./levels/test_levels/unsolvable.lvl")
+    board = level.get_board()
+    dead = dead_squares(board)
+    assert not dead[board.index(6, 2)]
+    assert dead[board.index(4, 2)]
+    assert dead[board.index(1, 1)]
+
+    level_matrix = np.zeros((6, 6), np.uint8)
+    for dest in [(1, 4), (2, 4), (3, 4), (4, 4)]:
+        level_matrix[dest] = const.DESTINATION
+    board = Board(level_matrix)
+    detector = DeadlockDetector(board, True)
+    block = board.pack(GameStatus(np.array([0, 0]), {(2, 2), (3, 2), (2, 3), (3, 3)}))
+    assert detector.is_freeze_deadlock(block.boxes, board.index(3, 3))
+    line = board.pack(GameStatus(np.array([0, 0]), {(2, 2), (3, 2), (2, 3), (4, 3)}))
+    assert not detector.is_freeze_deadlock(line.boxes, board.index(4, 3))
+    on_dest = board.pack(GameStatus(np.array([0, 0]), {(1, 4), (2, 4), (1, 3), (2, 3)}))
+    assert detector.is_freeze_deadlock(on_dest.boxes, board.index(2, 3))
+
+    level_matrix = np.ones((7, 5), np.uint8)
+    level_matrix[1:6, 1] = const.NOTHING
+    level_matrix[1:6, 3] = const.NOTHING
+    level_matrix[3, 2] = const.NOTHING
+    level_matrix[1, 1] = level_matrix[3, 3] = const.DESTINATION
+    board = Board(level_matrix)
+    detector = DeadlockDetector(board, True)
+    corral = board.pack(GameStatus(np.array([2, 3]), {(3, 2), (3, 1)}))
+    assert not detector.is_dead_push(corral.boxes, board.index(3, 2))
+    assert detector.is_corral_deadlock(board.walk_distances(corral.player, corral.boxes), corral.boxes)
+    opened = board.pack(GameStatus(np.array([4, 1]), {(3, 2), (1, 1)}))
+    assert not detector.is_corral_deadlock(board.walk_distances(opened.player, opened.boxes), opened.boxes)
+    assert Level(False, "./levels/level2.lvl").solve("push", True) == 53
+
+
+def test_solver_cache(tmp_path):
+    """Tests that solver results are cached on disk, evicted and invalidated when a changed level is saved"""
+    cache = SolverCache(str(tmp_path / "cache"))
+    level = Level(True, "./levels/level2.lvl", cache=cache)
+    key = level.get_hash()
+    assert cache.get(key) == {"moves": 53, "path": None}
+    assert SolverCache(str(tmp_path / "cache")).get(key)["moves"] == 53
+
+    level.filepath = str(tmp_path / "level2.lvl")
+    level.matrix[0, 5] = const.WALL
+    level.save()
+    assert cache.get(key) is None
+    assert Level(True, level.filepath, cache=cache).optimal_moves == 53
+
+    small_cache = SolverCache(str(tmp_path / "small"), max_bytes=100, memory_entries=1)
+    for i in range(10):
+        small_cache.put(str(i), i)
+    assert len(list((tmp_path / "small").iterdir())) < 10
+    assert small_cache.get("9")["moves"] == 9
+    assert small_cache.get("0") is None
+
+
+def test_validate_directory():
+    """Tests that the batch validator reports results and failures of every level"""
+    reports = validate_directory("./levels/test_levels", jobs=2)
+    assert [report["error"] for report in reports] == ["Invalid character loaded from file",
+                                                       "Level has incorrect count of objects",
+                                                       "Level is not solvable"]
+    reports = validate_directory("./levels", jobs=2, time_limit=30)
+    assert [report["moves"] for report in reports] == [10, 53, 114, 3]
+    assert all(report["expanded"] > 0 for report in reports)
+    assert "Moves" in format_table(reports)
+
+
+def test_packed_status_unmove():
+    """Tests that unmove finds exactly the statuses that move into the given one"""
+    level = Level(False, "./levels/level2.lvl")
+    board = level.get_board()
+    status = board.pack(level.game_status)
+    for action in [Action.MOVE_DOWN, Action.MOVE_RIGHT, Action.MOVE_RIGHT, Action.MOVE_UP, Action.MOVE_RIGHT,
+                   Action.MOVE_DOWN, Action.MOVE_LEFT]:
+        offset = board.get_offset(action)
+        moved = status.move(offset, board.walls)
+        if moved is status:
+            continue
+        assert status in moved.unmove(offset, board.walls)
+        assert all(prev.move(offset, board.walls) == moved for prev in moved.unmove(offset, board.walls))
+        status = moved
+
+
+def test_level_bidirectional():
+    """Tests that the bidirectional search finds the same optimal count of moves as bfs"""
+    for filepath in ["./levels/tutorial.lvl", "./levels/level1.lvl", "./levels/level2.lvl", "./levels/level3.lvl"]:
+        level = Level(False, filepath)
+        assert level.solve("bidirectional") == level.bfs()
+    assert Level(False, "./levels/test_levels/unsolvable.lvl").solve("bidirectional") == -1
+
+
+def test_transposition_table():
+    """Tests that the transposition table stays within its size and replaces the shallowest entries"""
+    table = TranspositionTable(1 << 30)
+    assert table.nbytes < 1 << 20
+    keys = ZobristKeys(synthetic_level(50).get_board()).box[:2000]
+    for value, key in enumerate(keys):
+        table.store(key, value)
+    assert table.nbytes >= 4000 * 12 and table.size + table.replaced >= 2000 and table.replaced < 200
+    assert table.get(keys[-1]) == 1999
+    table = TranspositionTable(1000)
+    assert table.nbytes <= 1000
+    for key in range(1, 200):
+        table.store(key << 20, key)
+    assert table.replaced > 0
+    assert table.get(199 << 20) == 199
+    assert table.get(1 << 20) is None
+    table.store(199 << 20, 5)
+    assert table.get(199 << 20) == 5
+
+    level = Level(False, "./levels/level2.lvl")
+    board = level.get_board()
+    keys = ZobristKeys(board)
+    status = board.pack(level.game_status)
+    assert keys.hash(status) != keys.hash(PackedStatus(status.player + 1, status.boxes))
+    assert keys.hash(status) == ZobristKeys(board).hash(board.pack(level.game_status.copy()))
+
+
+def test_level_bounded():
+    """Tests that the bounded engine stays optimal in little memory and reports a budget too small"""
+    for filepath in ["./levels/level1.lvl", "./levels/level2.lvl", "./levels/level3.lvl"]:
+        level = Level(False, filepath)
+        assert level.solve("bounded", budget=SolverBudget(1 << 20)) == level.bfs()
+    with pytest.raises(ValueError):
+        Level(False, "./levels/level3.lvl").solve("bounded", budget=SolverBudget(1 << 12))
+    with pytest.raises(ValueError):
+        Level(False, "./levels/level3.lvl").solve("bfs", budget=SolverBudget(1 << 16))
+
+
+def test_level_renderer():
+    """Tests that the renderer redraws only the cells that changed"""
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    pygame.display.init()
+    try:
+        level = Level(False, "./levels/tutorial.lvl")
+        display_surf = pygame.display.set_mode((get_img_size() * level.matrix.shape[0],
+                                                get_img_size() * level.matrix.shape[1]))
+        renderer = LevelRenderer(display_surf)
+        assert renderer.render(level) == [display_surf.get_rect()]
+        assert renderer.render(level) == []
+        level.handle_action(Action.MOVE_RIGHT)
+        assert len(renderer.render(level)) == 2
+        level.handle_action(Action.MOVE_RIGHT)
+        assert len(renderer.render(level)) == 3
+        level.matrix[1, 1] = const.WALL
+        assert len(renderer.render(level)) == 1
+        assert len(renderer.render(level, np.array([2, 2]))) == 1
+    finally:
+        pygame.display.quit()
+
+
+def test_event_loop():
+    """Tests that the event loop keeps the order of actions and runs jobs between frames"""
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    pygame.display.init()
+    try:
+        pygame.display.set_mode((10, 10))
+        loop = EventLoop(100)
+        pygame.event.clear()
+        pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_UP))
+        pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_a))
+        pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_r))
+        assert loop.get_action() == Action.MOVE_UP
+        assert loop.get_action() == Action.RESET
+
+        steps = []
+        loop.add_job(lambda: steps.append(1) or len(steps) >= 3)
+        # a job runs once per frame
+        assert loop.get_action() == Action.NOTHING and len(steps) == 1
+        while loop.jobs:
+            assert loop.get_action() == Action.NOTHING
+        assert len(steps) == 3
+        pygame.event.post(pygame.event.Event(pygame.QUIT))
+        assert loop.get_action() == Action.EXIT
+    finally:
+        pygame.display.quit()
+
+
+def test_font_registry():
+    """Tests that rendered texts are cached and the least recently used ones are evicted"""
+    pygame.font.init()
+    fonts = FontRegistry(2)
+    first = fonts.render("Play", 30)
+    assert fonts.render("Play", 30) is first
+    assert fonts.render("Play", 30, (255, 0, 0)) is not first
+    assert len(fonts.fonts) == 1
+    fonts.render("Edit", 30)
+    assert fonts.render("Play", 30) is not first
+
+
+def test_background_solve(tmp_path):
+    """Tests that a level is solved in the background, can be cancelled and is cached afterwards"""
+    cache = SolverCache(str(tmp_path))
+    level = Level(False, "./levels/level2.lvl", cache=cache)
+    solving = BackgroundSolve(level)
+    assert solving.poll(30)
+    assert solving.error is None and level.optimal_moves == 53
+    level = Level(False, "./levels/level2.lvl", cache=cache)
+    assert BackgroundSolve(level).done and level.optimal_moves == 53
+
+    level = Level(False, "./levels/too complex for bfs/originallevel1.lvl", cache=cache)
+    solving = BackgroundSolve(level)
+    assert not solving.poll(0.5)
+    solving.cancel()
+    assert solving.done and solving.error == "Cancelled" and not solving.process.is_alive()
+    solving = BackgroundSolve(Level(False, "./levels/test_levels/unsolvable.lvl", cache=None))
+    assert solving.poll(30)
+    assert solving.error == "Level is not solvable"
+
+    level = Level(False, "./levels/level2.lvl", cache=None)
+    solving = BackgroundSolve(level, paths=True, anytime=True)
+    assert solving.poll(30)
+    assert solving.error is None and solving.best == 53 and level.proven and len(parse_moves(solving.path)) == 53
+
+    # SDL ignores SIGTERM after pygame.init(), the forked worker still stops soon after the cancel
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
+    pygame.init()
+    try:
+        level = Level(False, "./levels/too complex for bfs/originallevel1.lvl", cache=None)
+        solving = BackgroundSolve(level, paths=True, anytime=True)
+        assert not solving.poll(0.5)
+        started = time.perf_counter()
+        solving.cancel()
+        assert time.perf_counter() - started < CANCEL_TIMEOUT and not solving.process.is_alive()
+    finally:
+        pygame.quit()
+
+
+def test_level_pack(tmp_path):
+    """Tests that levels of a pack are indexed once and loaded by their number"""
+    pack = LevelPack("./levels/test_levels/test_pack.xsb", str(tmp_path))
+    assert len(pack) == 3
+    assert pack.get_titles() == ["Tutorial", "Level 2", "Level 3"]
+    assert len(list(tmp_path.iterdir())) == 1
+    assert LevelPack("./levels/test_levels/test_pack.xsb", str(tmp_path)).index == pack.index
+
+    tutorial = Level(False, "./levels/test_levels/test_pack.xsb", pack_index=0)
+    assert np.array_equal(tutorial.matrix, Level(False, "./levels/tutorial.lvl").matrix)
+    assert tutorial.game_status == Level(False, "./levels/tutorial.lvl").game_status
+    assert Level(False, "./levels/test_levels/test_pack.xsb", pack_index=1).solve() == 53
+    small = Level(False, "./levels/test_levels/test_pack.xsb", pack_index=2)
+    assert small.game_status.box_pos == {(5, 1), (7, 1)}
+    assert small.solve() == 1
+    with pytest.raises(ValueError):
+        Level(False, "./levels/test_levels/test_pack.xsb", pack_index=3)
+    with pytest.raises(ValueError):
+        small.save()
+
+
+def test_parse_and_serialize(tmp_path):
+    """Tests that levels are parsed from and saved to the same text"""
+    for filepath in Path("./levels").glob("*.lvl"):
+        level = Level(False, str(filepath))
+        with open(filepath, 'r', encoding="utf-8") as file:
+            lines = file.read().splitlines()
+        width = max(len(line) for line in lines)
+        assert level.serialize().splitlines() == [line.ljust(width) for line in lines]
+
+    level = Level(False, cache=None)
+    level.parse(["#####", "#+$*#", "#-_.#", "###"])
+    assert level.matrix.shape == (5, 4)
+    assert level.matrix[1, 1] == const.DESTINATION and level.matrix[2, 2] == const.NOTHING
+    assert np.array_equal(level.game_status.player_pos, [1, 1])
+    assert level.game_status.box_pos == {(2, 1), (3, 1)}
+    assert level.serialize() == "#####\n#P$B#\n#  .#\n###  \n"
+    level.filepath = str(tmp_path / "saved.lvl")
+    level.save()
+    saved = Level(False, level.filepath, cache=None)
+    assert np.array_equal(saved.matrix, level.matrix) and saved.game_status == level.game_status
+
+    with pytest.raises(ValueError):
+        level.parse(["#@ x#"])
+    with pytest.raises(ValueError):
+        level.parse(["#@ ž#"])
+    level.parse(["#@$.#"])
+    level.game_status.box_pos = frozenset({(0, 0)})
+    with pytest.raises(ValueError):
+        level.serialize()
+    level.game_status.box_pos = frozenset({(1, 0)})
+    with pytest.raises(ValueError):
+        level.serialize()
+
+
+def test_level_index(tmp_path, monkeypatch):
+    """Tests that the level index is reused, updated when levels change and filled from solver results"""
+    levels = tmp_path / "levels"
+    levels.mkdir()
+    for name in ["tutorial", "level1"]:
+        (levels / (name + ".lvl")).write_text(Path("./levels/" + name + ".lvl").read_text())
+    (levels / "broken.lvl").write_text("#x#\n")
+    cache = SolverCache(None)
+    index = LevelIndex(str(tmp_path / "index.json"), cache)
+    entries = {Path(entry["path"]).stem: entry for entry in index.scan(str(levels))}
+    assert (entries["tutorial"]["cols"], entries["tutorial"]["boxes"], entries["tutorial"]["moves"]) == (9, 1, None)
+    assert entries["broken"]["error"] == "Invalid character loaded from file"
+    assert sorted(entries.values(), key=get_difficulty)[-1] is entries["broken"]
+
+    index.set_result(str(levels / "tutorial.lvl"), 3, entries["tutorial"]["hash"])
+    index.set_result(str(levels / "level1.lvl"), 99, "outdated hash")
+    index.store()
+    cache.put(entries["level1"]["hash"], 10)
+    monkeypatch.setattr(LevelIndex, "describe", lambda *args: pytest.fail("unchanged level was loaded again"))
+    index = LevelIndex(str(tmp_path / "index.json"), cache)
+    entries = {Path(entry["path"]).stem: entry for entry in index.scan(str(levels))}
+    assert entries["tutorial"]["moves"] == 3
+    assert entries["level1"]["moves"] == 10
+    assert get_label(entries["tutorial"]) == "tutorial (3 moves)"
+    monkeypatch.undo()
+
+    (levels / "broken.lvl").unlink()
+    os.utime(levels / "tutorial.lvl", ns=(0, 0))
+    text = (levels / "level1.lvl").read_text()
+    (levels / "level1.lvl").write_text(text.replace("#", " ", 1))
+    entries = {Path(entry["path"]).stem: entry for entry in index.scan(str(levels))}
+    assert sorted(entries) == ["level1", "tutorial"]
+    assert len(index.entries) == 2
+    assert entries["tutorial"]["moves"] == 3
+    assert entries["level1"]["moves"] is None
+
+
+def test_replay():
+    """Tests that recorded moves are replayed and solutions verified without a display"""
+    level = Level(False, "./levels/tutorial.lvl", cache=None)
+    level.optimal_moves = 3
+    assert parse_moves("uRd L") == [0, 1, 2, 3]
+    assert parse_moves([Action.MOVE_LEFT, Action.MOVE_UP]) == [3, 0]
+    assert format_moves([0, 1, 2, 3], [1]) == "uRdl"
+    with pytest.raises(ValueError):
+        parse_moves("urx")
+    with pytest.raises(ValueError):
+        parse_moves([Action.ENTER])
+
+    solution = None
+    for moves in ("".join(path) for path in itertools.product(LURD, repeat=3)):
+        if level.replay(moves)["solved"]:
+            solution = moves
+    assert solution is not None
+    actions = [MOVE_ACTIONS[direction] for direction in parse_moves(solution)]
+    expected = level.game_status
+    for action in actions:
+        expected = expected.handle_action(action, level.matrix)
+    report = level.replay(actions)
+    assert report["status"] == expected and report["valid"] and report["solved"] and report["optimal"]
+    assert report["moves"] == 3 and report["pushes"] >= 1
+
+    reports = level.verify_solutions([solution, solution[:2], "x", "uuuuuuuuuu", ""], jobs=2)
+    assert [report["valid"] for report in reports] == [True, True, False, False, True]
+    assert [report["solved"] for report in reports] == [True, False, False, False, False]
+    assert [report["optimal"] for report in reports] == [True, False, False, False, False]
+    assert reports[3]["error"].endswith("walks into a wall")
+    assert level.verify_solutions([solution, "x"]) == reports[::2][:1] + [reports[2]]
+
+    start = level.game_status
+    assert level.apply_moves(solution)["solved"]
+    assert level.is_win() and level.moves == 3 and level.game_status != start
+
+
+def test_benchmark():
+    """Tests that benchmarks report their rates and slowdowns against the baseline are found"""
+    assert "solve:originallevel1" in get_benchmarks()
+    result = run_benchmark("io:load", 30)
+    assert result["complete"] and result["error"] is None
+    assert result["count"] > 0 and result["rate"] > 0 and result["unit"] == "loads/s"
+    assert synthetic_level(6).solve() > 0
+    results = {"io:load": result, "io:save": {"rate": None}}
+    assert compare(results, {"io:load": {"rate": result["rate"] / 2}}) == []
+    assert compare(results, {"io:load": {"rate": result["rate"] * 2}, "io:save": {"rate": 1}}) == ["io:load"]
+    assert "io:load" in format_benchmarks(results, {"io:load": {"rate": result["rate"]}})
+
+
+def test_solver_stats():
+    """Tests that the solver reports its work, prune reasons and progress through the stats"""
+    level = Level(False, "./levels/level3.lvl", cache=None)
+    reports = []
+    stats = SolverStats(lambda reported: reports.append((reported.expanded, reported.result)), 100)
+    assert level.solve("push", stats=stats) == 114
+    assert stats.result == 114 and stats.elapsed > 0
+    assert reports[-1] == (stats.expanded, 114)
+    assert [expanded for expanded, _ in reports[:-1]] == list(range(100, stats.expanded + 1, 100))
+    assert sum(stats.frontier) == stats.generated and stats.duplicates > 0
+    assert stats.pruned.get("dead square", 0) + stats.pruned.get("freeze", 0) > 0
+    assert stats.memory == stats.states * STATE_BYTES > 0
+    assert json.loads(json.dumps(stats.as_dict()))["result"] == 114
+
+    stats = SolverStats()
+    assert Level(False, "./levels/test_levels/unsolvable.lvl", cache=None).solve("bfs", stats=stats) == -1
+    assert stats.result == -1 and stats.expanded > 0 and len(stats.frontier) > 1
+
+    stats = SolverStats()
+    with pytest.raises(ValueError):
+        level.solve("bfs", stats=stats, budget=SolverBudget(1000))
+    assert stats.result is None
+
+
+def wait_for_validation(validator: LiveValidator) -> str:
+    """Polls the validator until it is done, returns its status"""
+    deadline = time.perf_counter() + 30
+    while validator.is_busy() and time.perf_counter() < deadline:
+        validator.poll()
+        time.sleep(0.01)
+    return validator.status
+
+
+def test_live_validation():
+    """Tests that edited levels are validated in one worker, stale solves are dropped and board tables reused"""
+    validator = LiveValidator(debounce=0)
+    try:
+        level = Level(False, "./levels/level3.lvl", cache=None)
+        validator.edited(level)
+        validator.poll()
+        assert validator.solving
+        level = Level(False, "./levels/tutorial.lvl", cache=None)
+        validator.edited(level)
+        assert validator.status == "Editing..."
+        assert wait_for_validation(validator) == "Optimal moves: 3"
+        process = validator.process
+
+        level.game_status.box_pos = frozenset()
+        validator.edited(level)
+        assert wait_for_validation(validator).startswith("Level has incorrect count of objects (0 boxes")
+        level = Level(False, "./levels/test_levels/unsolvable.lvl", cache=None)
+        validator.edited(level)
+        assert wait_for_validation(validator) == "Not solvable"
+        assert validator.process is process
+    finally:
+        validator.close()
+    assert validator.process is None
+
+    board = Level(False, "./levels/level1.lvl").get_board()
+    same_board = Level(False, "./levels/level1.lvl").get_board()
+    assert get_dead_squares(board) is get_dead_squares(same_board)
+    assert get_push_distances(board) is get_push_distances(same_board)
+
+
+def test_renderer_overlay():
+    """Tests that the overlay is redrawn over changed cells and the cells under a removed overlay are restored"""
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    pygame.display.init()
+    try:
+        level = Level(False, "./levels/tutorial.lvl")
+        img_size = get_img_size()
+        display_surf = pygame.display.set_mode((img_size * level.matrix.shape[0], img_size * level.matrix.shape[1]))
+        renderer = LevelRenderer(display_surf)
+        overlay = Surface((img_size * 2, img_size // 2))
+        renderer.render(level, overlay=overlay)
+        assert renderer.render(level, overlay=overlay) == []
+        assert len(renderer.render(level, overlay=Surface((img_size + 1, 1)))) == 2
+        assert len(renderer.render(level)) == 2
+        assert renderer.get_cells(pygame.Rect(-5, 0, img_size * 100, 1)) == [(col, 0) for col in
+                                                                             range(level.matrix.shape[0])]
+    finally:
+        pygame.display.quit()
+
+
+def test_hints(tmp_path):
+    """Tests that optimal solutions are found with their paths and hints follow them and the statuses off them"""
+    level = Level(False, "./levels/level2.lvl", cache=None)
+    board = level.get_board()
+    start = board.pack(level.game_status)
+    path = solve_path(board, start)
+    assert len(path) == level.solve() == 53
+    assert replay(board, start, path)["solved"]
+    assert solve_path(board, board.pack(Level(False, "./levels/test_levels/unsolvable.lvl").game_status)) is None
+    walk = board.walk_path(start.player, start.player + 2 * board.offsets[2], 0)
+    assert walk == [2, 2]
+    with pytest.raises(ValueError):
+        board.walk_path(start.player, 0, 0)
+
+    solving = BackgroundSolve(Level(False, "./levels/level2.lvl", cache=SolverCache(str(tmp_path))), paths=True)
+    assert solving.poll(30)
+    assert solving.moves == 53 and replay(board, start, parse_moves(solving.path))["solved"]
+    hints = HintEngine(level)
+    assert hints.get(level.game_status) is None
+    hints.add_solution(level.game_status, solving.path)
+    assert hints.get(level.game_status) == (53, MOVE_ACTIONS[path[0]])
+    assert hints.request(level.game_status) == "Hint: " + MOVE_ACTIONS[path[0]].name.split("_")[1].lower() + \
+        ", 53 moves left"
+
+    # a move other than the hinted one leaves the optimal solution
+    start_status = level.game_status.copy()
+    for direction in range(4):
+        if direction != path[0] and level.game_status == start_status:
+            level.handle_action(MOVE_ACTIONS[direction])
+    assert level.game_status != start_status and hints.get(level.game_status) is None
+    assert hints.request(level.game_status) == "Computing hint..."
+    while not hints.poll():
+        time.sleep(0.05)
+    remaining, action = hints.get(level.game_status)
+    assert remaining == Level(False, matrix=level.matrix, game_status=level.game_status, cache=None).solve()
+    level.handle_action(action)
+    assert hints.get(level.game_status)[0] == remaining - 1
+
+
+def test_large_level(monkeypatch):
+    """Tests that positions of large levels do not overflow and the renderer draws only the view following the
+    player"""
+    level = Level(False, cache=None)
+    level.parse(["#" * 300, "#" + " " * 296 + "$@#", "#" + "." + " " * 297 + "#", "#" * 300])
+    assert np.array_equal(level.game_status.player_pos, [298, 1])
+    assert level.game_status.box_pos == {(297, 1)}
+    level.handle_action(Action.MOVE_LEFT)
+    assert np.array_equal(level.game_status.player_pos, [297, 1]) and level.game_status.box_pos == {(296, 1)}
+    board = level.get_board()
+    assert board.unpack(board.pack(level.game_status)) == level.game_status
+    assert board.dest_mask == 1 << board.index(1, 2)
+
+    # walks of large boards are searched a layer of cells at once, with the same result
+    level = synthetic_level(60)
+    board = level.get_board()
+    start = board.pack(level.game_status)
+    distances = board.walk_distances(start.player, start.boxes)
+    monkeypatch.setattr("board.ARRAY_WALK_SIZE", board.size)
+    assert distances == board.walk_distances(start.player, start.boxes) and len(distances) == 58 * 58 - 2
+    dead = get_dead_squares(board)
+    assert dead[board.index(1, 58)] and not dead[board.index(1, 1)] and not dead[board.index(29, 29)]
+
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    pygame.display.init()
+    try:
+        level = synthetic_level(200)
+        img_size = get_img_size()
+        display_surf = pygame.display.set_mode((img_size * 6, img_size * 5))
+        renderer = LevelRenderer(display_surf)
+        assert renderer.render(level) == [display_surf.get_rect()]
+        assert renderer.view == (6, 5) and renderer.camera == (0, 195)
+        assert renderer.matrix.shape == (6, 5)
+        level.handle_action(Action.MOVE_UP)
+        assert len(renderer.render(level)) == 2 and renderer.camera == (0, 195)
+        level.handle_action(Action.MOVE_UP)
+        assert renderer.render(level) == [display_surf.get_rect()] and renderer.camera == (0, 194)
+        assert renderer.get_cells(pygame.Rect(0, 0, img_size, img_size)) == [(0, 194)]
+        assert renderer.render(level, np.array([199, 0])) == [display_surf.get_rect()] and renderer.camera == (194, 0)
+    finally:
+        pygame.display.quit()
+
+
+def test_level_batch_bfs():
+    """Tests that the batched search finds the same optimal count of moves as bfs and counts its work"""
+    for filepath in ["./levels/tutorial.lvl", "./levels/level1.lvl", "./levels/level2.lvl",
+                     "./levels/test_levels/unsolvable.lvl", "./levels/test_levels/too_many_boxes.lvl"]:
+        level = Level(False, filepath)
+        assert level.solve("batch") == level.solve("bfs")
+    stats = SolverStats()
+    assert synthetic_level(9).solve("batch", stats=stats) == 23
+    assert stats.generated == sum(stats.frontier) and stats.expanded > stats.frontier[-1]
+    assert stats.pruned["dead square"] > 0 and stats.duplicates > 0
+
+    board = Level(False, "./levels/level1.lvl").get_board()
+    codec = StateCodec(board, 2)
+    players = np.array([board.index(3, 3), board.index(3, 3), board.index(4, 3)])
+    boxes = np.array([[board.index(2, 4), board.index(5, 3)]] * 3)
+    keys = codec.encode(players, boxes)
+    assert keys[0] == keys[1] and keys[0] != keys[2]
+    codec = StateCodec(board, 20)
+    wide_keys = codec.encode(players, np.repeat(boxes, 10, axis=1))
+    assert codec.words > 1 and wide_keys[0] == wide_keys[1] and wide_keys[0] != wide_keys[2]
+    key_set = KeySet()
+    key_set.add(keys[:1])
+    for key in range(1, 10):
+        key_set.add(np.array([key * 1000], np.uint64))
+    assert key_set.size == 10 and len(key_set.chunks) < 10
+    assert key_set.contains(np.concatenate((keys, np.array([5000, 5001], np.uint64)))).tolist() == \
+        [True, True, False, True, False]
+
+
+def test_move_history(tmp_path, monkeypatch):
+    """Tests that moves are taken back and played again, sought from checkpoints and saved as a replay"""
+    filepath = tmp_path / "level2.lvl"
+    filepath.write_text(Path("./levels/level2.lvl").read_text())
+    level = Level(False, str(filepath), cache=None)
+    statuses = [level.game_status]
+    for action in random_actions(300):
+        level.handle_action(action)
+        if level.game_status != statuses[-1]:
+            statuses.append(level.game_status)
+    assert level.moves == len(level.history) == len(statuses) - 1 > 2 * CHECKPOINT_INTERVAL
+    assert any(letter.isupper() for letter in level.history.get_moves())
+    while level.undo():
+        assert level.game_status == statuses[level.moves]
+    assert level.moves == 0 and not level.undo()
+    for _ in range(100):
+        level.handle_action(Action.REDO)
+    assert level.game_status == statuses[100]
+    assert level.history.seek(len(statuses) - 1) == statuses[-1]
+    assert level.history.seek(CHECKPOINT_INTERVAL + 1) == statuses[CHECKPOINT_INTERVAL + 1]
+    level.game_status = statuses[CHECKPOINT_INTERVAL + 1]
+    level.moves = level.history.position
+
+    # the moves taken back are kept while the same moves are played again
+    moves = level.history.get_moves(len(statuses) - 1)
+    filepath.unlink()
+    level.handle_action(Action.RESET)
+    assert level.game_status == statuses[0] and len(level.history) == len(statuses) - 1
+    level.apply_moves(moves[:10])
+    assert level.game_status == statuses[10] and len(level.history) == len(statuses) - 1
+    other = [action for action in MOVE_ACTIONS if level.game_status.handle_action(action, level.matrix) not in
+             (level.game_status, statuses[11])]
+    level.handle_action(other[0])
+    assert level.moves == len(level.history) == 11
+
+    replay_path = str(tmp_path / "level2.lurd")
+    level.restart()
+    solution = format_moves(solve_path(level.get_board(), level.get_board().pack(level.game_status)))
+    level.apply_moves(solution)
+    level.save_moves(replay_path)
+    level.restart()
+    level.optimal_moves = 53
+    report = level.load_moves(replay_path)
+    assert report["valid"] and report["solved"] and report["optimal"] and level.is_win()
+    assert report["moves"] == level.moves == 53 and report["lurd"] == level.history.get_moves()
+    assert report["pushes"] == sum(letter.isupper() for letter in report["lurd"])
+    Path(replay_path).write_text(solution[:5] + "x")
+    report = level.load_moves(replay_path)
+    assert not report["valid"] and level.moves == 0
+    Path(replay_path).write_text(solution[:5] + solution[:5])
+    report = level.load_moves(replay_path)
+    assert not report["valid"] and report["moves"] == level.moves and report["error"].startswith("Move " + str(
+        level.moves + 1) + " ")
+    # an error in a later chunk is numbered from the start of the level
+    monkeypatch.setattr("level.REPLAY_CHUNK", 4)
+    report = level.load_moves(replay_path)
+    assert not report["valid"] and report["moves"] == level.moves and report["error"].startswith("Move " + str(
+        level.moves + 1) + " ")
+
+
+def test_edit_history():
+    """Tests that edits of cells, boxes, the player and the size are taken back and made again"""
+    level = Level(False, "./levels/tutorial.lvl", cache=None)
+    matrix = level.matrix.copy()
+    status = level.game_status.copy()
+    history = EditHistory()
+    history.edit(level, "cell", const.WALL, (1, 1))
+    history.edit(level, "boxes", frozenset())
+    history.edit(level, "matrix", np.zeros((3, 3), np.uint8))
+    history.edit(level, "cell", const.DESTINATION, (2, 2))
+    history.edit(level, "player", np.array([1, 2], const.POSITION))
+    edited = level.matrix.copy()
+    assert level.matrix.shape == (3, 3) and level.matrix[2, 2] == const.DESTINATION
+    while history.undo(level):
+        pass
+    assert np.array_equal(level.matrix, matrix) and level.game_status == status
+    while history.redo(level):
+        pass
+    assert np.array_equal(level.matrix, edited) and list(level.game_status.player_pos) == [1, 2]
+    history.undo(level)
+    history.undo(level)
+    history.edit(level, "cell", const.WALL, (0, 0))
+    assert not history.redo(level) and len(history.edits) == 4 and level.matrix[2, 2] == const.NOTHING
+
+
+def test_solve_anytime():
+    """Tests that the anytime solver proves small levels optimal and keeps the best solution found within its limits"""
+    level = Level(False, "./levels/level2.lvl", cache=None)
+    bounds = []
+    board = level.get_board()
+    report = solve_anytime(board, board.pack(level.game_status), callback=bounds.append)
+    assert report["proven"] and report["moves"] == 53 and report["lower"] == 53
+    assert bounds[-1] == 53 and bounds == sorted(bounds, reverse=True)
+    assert replay(board, board.pack(level.game_status), report["path"])["moves"] == 53
+    assert replay(board, board.pack(level.game_status), report["path"])["solved"]
+
+    level = Level(False, "./levels/too complex for bfs/originallevel1.lvl", cache=None)
+    stats = SolverStats()
+    report = level.solve_anytime(node_limit=20000, stats=stats)
+    assert not report["proven"] and stats.expanded < 20000 + 2000
+    assert report["moves"] == -1 or report["moves"] >= report["lower"] > 0
+
+    report = Level(False, "./levels/test_levels/unsolvable.lvl", cache=None).solve_anytime(node_limit=20000)
+    assert report["proven"] and report["moves"] == -1
+
+    level = Level(False, "./levels/level2.lvl", cache=None)
+    level.check_level(time_limit=60)
+    assert level.proven and level.optimal_moves == 53
+    level = Level(False, "./levels/test_levels/unsolvable.lvl", cache=None)
+    with pytest.raises(ValueError, match="not solvable"):
+        level.check_level(node_limit=20000)
+
+
+def test_generator(tmp_path):
+    """Tests that generated levels are solvable, hit the target and are saved as levels and as a ranked pack"""
+    level, report = generate_level((8, 8), 2, 6, seed=1)
+    assert report["pushes"] == 6 and report["proven"]
+    assert level.serialize() == generate_level((8, 8), 2, 6, seed=1)[0].serialize()
+    level.check_level()
+    assert level.optimal_moves == report["moves"] >= report["pushes"]
+    layers = pull_search(level.get_board(), 3)
+    assert len(layers) <= 4 and all(layers)
+    with pytest.raises(ValueError):
+        generate_level((3, 8), 1, 5)
+
+    reports = generate_levels(4, (8, 8), 2, 15, "moves", jobs=2, tolerance=3)
+    assert sorted(report["seed"] for report in reports) == [0, 1, 2, 3]
+    assert all(report["error"] is None and abs(report["moves"] - 15) <= 3 for report in reports)
+    assert [report["moves"] for report in reports] == sorted(report["moves"] for report in reports)
+    save_pack(reports, str(tmp_path / "generated.xsb"))
+    pack = LevelPack(str(tmp_path / "generated.xsb"), None)
+    assert len(pack) == 4 and pack.get_titles()[0] == get_title(reports[0])
+    for number, report in enumerate(reports):
+        level = Level(False, str(tmp_path / "generated.xsb"), pack_index=number, cache=None)
+        assert level.serialize() == report["text"]
+    filepaths = save_levels(reports, str(tmp_path / "levels"))
+    level = Level(True, filepaths[0], cache=None)
+    assert level.optimal_moves == reports[0]["moves"]
@@ -0,0 +1,99 @@
+"""Zobrist hashing of game statuses and a transposition table of fixed size for the solver"""
+
+import random
+from array import array
+
+from board import Board, iter_cells
+from game_status import PackedStatus
+
+BUCKET_SIZE = 4
+# bytes of a 64-bit key and a 32-bit value
+ENTRY_BYTES = 12
+# slots of a new table, it doubles while it fits into its size
+INITIAL_CAPACITY = 1 << 12
+
+
+class ZobristKeys:
+    """Random 64-bit keys of every cell, for the player and for a box, the hash of a status is their xor"""
+
+    def __init__(self, board: Board, seed: int = 0):
+        generator = random.Random(seed)
+        self.player = [generator.getrandbits(64) for _ in range(board.size)]
+        self.box = [generator.getrandbits(64) for _ in range(board.size)]
+
+    def hash(self, status: PackedStatus) -> int:
+        """Computes the hash of a status from scratch, moves update it by xoring the keys of the changed cells"""
+        key = self.player[status.player]
+        for box in iter_cells(status.boxes):
+            key ^= self.box[box]
+        return key
+
+
+class TranspositionTable:
+    """Table of values keyed by 64-bit hashes, stored in flat arrays that never grow over max_bytes
+
+    Each key maps to a bucket of a few slots. The table starts small and doubles once half of it is used. When a bucket
+    is full, the entry with the smallest value is replaced, so the table keeps the states closest to the search
+    frontier."""
+
+    def __init__(self, max_bytes: int):
+        max_capacity = BUCKET_SIZE
+        while max_capacity * 2 * ENTRY_BYTES <= max_bytes:
+            max_capacity *= 2
+        self.max_capacity = max_capacity
+        self.replaced = 0
+        self.allocate(min(INITIAL_CAPACITY, max_capacity))
+
+    def allocate(self, capacity: int):
+        """Creates empty arrays of capacity slots"""
+        self.capacity = capacity
+        self.size = 0
+        self.bucket_mask = (capacity - 1) & ~(BUCKET_SIZE - 1)
+        self.keys = array('Q', bytes(8 * capacity))
+        self.values = array('i', bytes(4 * capacity))
+
+    def grow(self):
+        """Doubles the capacity and stores the entries again"""
+        entries = [(key, value) for key, value in zip(self.keys, self.values) if key != 0]
+        self.allocate(self.capacity * 2)
+        for key, value in entries:
+            self.store(key, value)
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the stored arrays in bytes"""
+        return self.capacity * ENTRY_BYTES
+
+    def get(self, key: int):
+        """Gets the value stored for the key, None if it is not stored"""
+        key = key or 1  # 0 marks an empty slot
+        start = key & self.bucket_mask
+        keys = self.keys
+        for slot in range(start, start + BUCKET_SIZE):
+            if keys[slot] == key:
+                return self.values[slot]
+        return None
+
+    def store(self, key: int, value: int):
+        """Stores the value for the key, replacing the entry with the smallest value of a full bucket"""
+        key = key or 1
+        start = key & self.bucket_mask
+        keys = self.keys
+        values = self.values
+        victim = start
+        for slot in range(start, start + BUCKET_SIZE):
+            if keys[slot] == key:
+                values[slot] = value
+                return
+            if keys[slot] == 0:
+                keys[slot] = key
+                values[slot] = value
+                self.size += 1
+                if self.size * 2 > self.capacity and self.capacity < self.max_capacity:
+                    self.grow()
+                return
+            if values[slot] < values[victim]:
+                victim = slot
+        self.replaced += 1
+        keys[victim] = key
+        values[victim] = value
@@ -0,0 +1,151 @@
+"""Headless batch validator, checks and solves every level in a directory across a pool of processes"""
+
+import argparse
+import json
+import multiprocessing
+import multiprocessing.connection
+import os
+import sys
+import time
+from pathlib import Path
+
+from level import Level
+from level_index import LEVEL_INDEX, NOT_SOLVABLE, LevelIndex
+import solver
+
+try:
+    import resource
+except ImportError:  # not available on Windows, the memory budget is then not enforced
+    resource = None
+
+
+def validate_level(filepath: str, engine: str = "push", memory_limit: int = 0) -> dict:
+    """Loads and solves a single level within the memory limit in MiB, returns a report of the result"""
+    report = {"level": filepath, "moves": None, "expanded": None, "time": None, "error": None, "hash": None,
+              "stats": None}
+    stats = solver.SolverStats()
+    start = time.perf_counter()
+    try:
+        level = Level(False, filepath, cache=None)
+        report["hash"] = level.get_hash()
+        # the solver reports the exceeded budget before the address space limit of the process is hit
+        level.check_level(engine, stats, solver.SolverBudget(memory_limit * 1024 * 1024 * 3 // 4))
+        report["moves"] = level.optimal_moves
+    except ValueError as e:
+        report["error"] = str(e)
+    except MemoryError:
+        report["error"] = "Memory budget exceeded"
+    except Exception as e:
+        report["error"] = "An unexpected error occurred: " + str(e)
+    report["expanded"] = stats.expanded
+    report["stats"] = stats.as_dict()
+    report["time"] = round(time.perf_counter() - start, 3)
+    return report
+
+
+def _worker(connection, filepath: str, engine: str, memory_limit: int):
+    """Validates a level in a child process, sends the report through the connection"""
+    if memory_limit > 0 and resource is not None:
+        limit = memory_limit * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    connection.send(validate_level(filepath, engine, memory_limit))
+    connection.close()
+
+
+def failed_report(filepath: str, error: str, elapsed: float = None) -> dict:
+    """Creates a report of a level whose worker did not finish"""
+    return {"level": filepath, "moves": None, "expanded": None,
+            "time": None if elapsed is None else round(elapsed, 3), "error": error, "hash": None, "stats": None}
+
+
+def validate_directory(directory: str, jobs: int = 0, time_limit: float = 60, memory_limit: int = 0,
+                       engine: str = "push") -> list:
+    """Validates every .lvl file in a directory, each level in its own process within the time and memory budget
+
+    Interrupting the validation terminates the running workers, the levels not finished are reported as cancelled."""
+    filepaths = sorted(str(f) for f in Path(directory).iterdir() if f.is_file() and f.name.endswith(".lvl"))
+    jobs = jobs if jobs > 0 else os.cpu_count() or 1
+    pending = list(reversed(filepaths))
+    running = {}
+    reports = {}
+    try:
+        while pending or running:
+            while pending and len(running) < jobs:
+                filepath = pending.pop()
+                receiver, sender = multiprocessing.Pipe(False)
+                process = multiprocessing.Process(target=_worker, args=(sender, filepath, engine, memory_limit),
+                                                  daemon=True)
+                process.start()
+                sender.close()
+                running[filepath] = (process, receiver, time.perf_counter())
+            multiprocessing.connection.wait([receiver for _, receiver, _ in running.values()], 0.05)
+            for filepath, (process, receiver, started) in list(running.items()):
+                elapsed = time.perf_counter() - started
+                if receiver.poll():
+                    try:
+                        reports[filepath] = receiver.recv()
+                    except EOFError:
+                        reports[filepath] = failed_report(filepath, "Memory budget exceeded", elapsed)
+                elif not process.is_alive():
+                    reports[filepath] = failed_report(filepath, "Worker exited with code " + str(process.exitcode),
+                                                      elapsed)
+                elif time_limit > 0 and elapsed > time_limit:
+                    process.terminate()
+                    reports[filepath] = failed_report(filepath, "Time budget exceeded", elapsed)
+                else:
+                    continue
+                process.join()
+                receiver.close()
+                del running[filepath]
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process, receiver, _ in running.values():
+            process.terminate()
+            process.join()
+            receiver.close()
+    return [reports.get(filepath, failed_report(filepath, "Cancelled")) for filepath in filepaths]
+
+
+def index_reports(reports: list, index: LevelIndex):
+    """Stores the optimal counts of moves of the solved levels into the level index"""
+    for report in reports:
+        if report["moves"] is not None:
+            index.set_result(report["level"], report["moves"], report["hash"])
+        elif report["error"] == NOT_SOLVABLE:
+            index.set_result(report["level"], -1, report["hash"])
+    index.store()
+
+
+def format_table(reports: list) -> str:
+    """Formats the reports as a text table"""
+    header = ("Level", "Moves", "Expanded", "Time [s]", "Error")
+    rows = [tuple("" if report[key] is None else str(report[key])
+                  for key in ("level", "moves", "expanded", "time", "error")) for report in reports]
+    widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+    return "\n".join("  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip()
+                     for row in [header] + rows)
+
+
+def main():
+    """Entry function"""
+    parser = argparse.ArgumentParser(description="Validates and solves every level in a directory")
+    parser.add_argument("directory", help="directory with .lvl files, e.g. levels")
+    parser.add_argument("-j", "--jobs", type=int, default=0, help="number of worker processes, all cores by default")
+    parser.add_argument("-t", "--time-limit", type=float, default=60, help="seconds per level, 0 for no limit")
+    parser.add_argument("-m", "--memory-limit", type=int, default=0, help="MiB per level, 0 for no limit")
+    parser.add_argument("-e", "--engine", default="push", choices=sorted(solver.ENGINES), help="solver engine")
+    parser.add_argument("-f", "--format", default="table", choices=["table", "json"], help="output format")
+    args = parser.parse_args()
+
+    reports = validate_directory(args.directory, args.jobs, args.time_limit, args.memory_limit, args.engine)
+    index_reports(reports, LEVEL_INDEX)
+    if args.format == "json":
+        print(json.dumps(reports, indent=2))
+    else:
+        print(format_table(reports))
+    sys.exit(1 if any(report["error"] is not None for report in reports) else 0)
+
+
+if __name__ == "__main__":
+    main()